@@ -1,159 +1,205 @@
 """API Module to get active notifications count of the user.
 
 It provides the following functionalities:
-1. make_connection(): Connecting to the Database using connection details received through environment variables
-2. log_err(): Logging error and returning the JSON response with error message & status code
-3. jwt_verify(): verifying token and fetching data from the jwt token sent by user
-4. handler(): Handling the incoming request with following steps:
+1. log_err(): Logging error and returning the prebuilt JSON response with error message & status code
+2. handler(): Handling the incoming request with following steps:
 - Fetching data required for api
-- getting all the notifications that are not visited by user from the database
+- getting a page of the notifications that are not visited by user from the database
 - sending the success json with the required data i.e. unvisited notifications
 
+The query string can carry `limit`, a `before` cursor (next page of older notifications)
+and a `since` cursor (only notifications newer than the last one seen). The cursors to
+use next are returned in the X-Next-Cursor and X-Since-Cursor headers. With
+`count_only=true` only the number of unvisited notifications is returned, for the bell badge.
+With `badge=true` the unread count and version of notification_badges are returned, and a
+request presenting the current version (`version` or If-None-Match) gets a bodiless 304.
+
+The DB connection is shared between warm invocations through profiles_common.db_connection
+and tokens are verified (and their users confirmed) through the cache of profiles_common.jwt_auth.
+Every request uses the primary, read replicas included: the badge and count a client polls
+right after reading a page must already reflect the notifications that page marked visited.
+The time spent in each phase is recorded through profiles_common.metrics.
+The response messages are compiled once per container by profiles_common.message_catalog
+and the language of a request is only kept in the handler's local variables.
+Logs are written as sampled, redacted JSON lines by profiles_common.structured_log.
+Pings of the lambda warmer are answered by profiles_common.warmup, which primes the container.
+
 """
 
-import jwt
 import json
-import pymysql
 import logging
-import traceback
 from os import environ
-import configparser
-
-# reading values from property file to get all the response messages
-config = configparser.ConfigParser()
-config.read('getactivenotifications.properties', encoding = "ISO-8859-1")
-
-# Getting the DB details from the environment variables to connect to DB
-endpoint = environ.get('ENDPOINT')
-port     = environ.get('PORT')
-dbuser   = environ.get('DBUSER')
-password = environ.get('DBPASSWORD')
-database = environ.get('DATABASE')
-
-# secret keys for data encryption and security token
+from os.path import dirname, join
+from profiles_common import db_connection, metrics, warmup, structured_log
+from profiles_common.message_catalog import MessageCatalog
+from profiles_common.jwt_auth import jwt_verify, get_user_language, get_cached_user, remember_user
+import notifications_feed
+import notification_badges
+
+# compiling the response messages of the property file, per language
+messages = MessageCatalog(join(dirname(__file__), 'getactivenotifications.properties'),
+                          status_codes={'UNAUTHORIZED': 403, 'INVALID_USER': 404})
+
+# secret key for data encryption
 key = environ.get('DB_ENCRYPTION_KEY')
-SECRET_KEY = environ.get('TOKEN_SECRET_KEY')
 
 #Logger key
 logging_Level = int(environ.get('LOGGING_LEVEL'))
-# getting message variable
-
-message_by_language = "165_MESSAGES"
 
 # Getting the logger to log the messages for debugging purposes
 logger   = logging.getLogger()
 # Setting the log level to INFO
 logger.setLevel(logging_Level)
+# Writing the records as sampled, redacted JSON lines
+structured_log.install(logger)
 
 logger.info("Cold start complete.")
 
-def make_connection():
-    """Function to make the database connection."""
-    return pymysql.connect(host=endpoint, user=dbuser, passwd=password,
-        port=int(port), db=database, autocommit=True)
-
-
-def log_err(errmsg, status_code):
+def log_err(message_key, language_id=None):
     """Function to log the error messages."""
-    logger.info(errmsg)
-    return  {
-                "statusCode": status_code,
-                "body": json.dumps({"message":errmsg}) , 
-                "headers":{
-                            'Access-Control-Allow-Origin': '*',
-                            'Access-Control-Allow-Credentials': 'true'}, 
-                "isBase64Encoded":"false"
-            }
+    logger.info(message_key)
+    return messages.error(message_key, language_id)
             
-def jwt_verify(auth_token):
-    """Function to verify the authorization token"""
-    # decoding the authorization token provided by user
-    payload = jwt.decode(auth_token, SECRET_KEY, options={'require_exp': True})
-    
-    # setting the required values in return
-    rid = int(payload['id'])
-    user_id = payload['user_id']
-    language_id = payload['language_id']
-    return rid, user_id, language_id
-
+@metrics.instrumented("getactivenotifications")
 def handler(event,context):
     """Function to handle the request for notifications API"""
-    global message_by_language
+    # answering the pings of the lambda warmer
+    if warmup.is_warmup(event):
+        return warmup.handle(event, context)
+    # language of the messages, the default one until the token is verified
+    language_id = None
     try:
         # getting data from the users request
         auth_token = event['headers']['Authorization']
+        params = notifications_feed.parse_feed_params(event)
     except:
-        logger.error(traceback.format_exc())
-        return log_err (config[message_by_language]['EVENT_DATA_STATUS'], 500)
+        logger.exception('EVENT_DATA_STATUS')
+        return log_err('EVENT_DATA_STATUS', language_id)
     
     try:
         # verifying that the user is authorized or not to see this api's data
-        rid, user_id, language_id = jwt_verify(auth_token)
+        with metrics.phase("jwt_verify"):
+            rid, user_id, language_id = jwt_verify(auth_token)
     except:
         # if user does not have valid authorization
-        logger.error(traceback.format_exc())
-        return log_err(config[message_by_language]['UNAUTHORIZED'], 403)
+        logger.exception('UNAUTHORIZED')
+        return log_err('UNAUTHORIZED', language_id)
     
     try:
-        # Making the DB connection
-        cnx    = make_connection()
-        # Getting the cursor from the DB connection to execute the queries
-        cursor = cnx.cursor()
-        try:
-            # query to get notification details of the user
-            query = "SELECT COUNT(*), `language_id` FROM `users` WHERE `id`=%s and `user_id`=%s"
-            # excecuting the query
-            cursor.execute(query, (rid, user_id))
-            users_list = []
-            # getting results list from cursor
-            for result in cursor: users_list.append(result)
-            # checking any user with particular rid and user_id exist or not
-            count = users_list[0][0]
-            
-            # getting current language_id of the user
-            language_id = users_list[0][1]
-            message_by_language = str(language_id) + "_MESSAGES"
-            
-            if count == 0:
-                return log_err(config[message_by_language]['INVALID_USER'], 404)
-        except:
-            logger.error(traceback.format_exc())
-            return log_err(config[message_by_language]['INTERNAL_ERROR'], 500)
-            
-        try:
+        # Getting a cursor on the warm (or freshly opened) DB connection, the counts stay on the
+        # primary too so that they see the visits of the page the client has just read
+        with metrics.phase("connect"):
+            cursor = db_connection.open_cursor()
+    except:
+        logger.exception('CONNECTION_STATUS')
+        return log_err('CONNECTION_STATUS', language_id)
+
+    try:
+        if params["badge"]:
             try:
-                # query to get notification details of the user
-                selectionQuery = "SELECT `notification_type`, `json` FROM `notifications` WHERE `rid`=%s AND `visited`=0 ORDER BY `timestamp` DESC"
-                # excecuting the query
-                cursor.execute(selectionQuery, (rid))
-                result_list = []
-                # getting results list from cursor and preparing json list
-                for result in cursor: result_list.append({"notification_type":result[0],"notification_json":json.loads(result[1])})
-                
-                # query to set visited status of all notifications when bell icon is clicked
-                updationQuery = "UPDATE `notifications` SET `visited`=1 WHERE `rid`=%s AND `visited`=0"
-                # excecuting the query
-                cursor.execute(updationQuery, (rid))
-                
-                # preparing success json  with result_list
+                # checking the user with particular rid and user_id exist and getting its current language_id
+                with metrics.phase("user_lookup"):
+                    user_language_id = get_user_language(auth_token, cursor)
+                if user_language_id is None:
+                    return log_err('INVALID_USER', language_id)
+                language_id = user_language_id
+
+                # reading the badge of the user, notifications are not read
+                with metrics.phase("badge"):
+                    unread, version = notification_badges.get_store().get(cursor, rid)
+                headers = {
+                            'Access-Control-Allow-Origin': '*',
+                            'Access-Control-Allow-Credentials': 'true',
+                            'Access-Control-Expose-Headers': 'ETag',
+                            'ETag': '"%d"' % version
+                          }
+                if params["version"] == version:
+                    # nothing changed since the version the client has seen
+                    return {
+                                'statusCode': 304,
+                                'headers': headers,
+                                'body': ''
+                            }
+                return {
+                            'statusCode': 200,
+                            'headers': headers,
+                            'body': json.dumps({"count": unread, "version": version})
+                        }
+            except:
+                logger.exception('INTERNAL_ERROR')
+                return log_err('INTERNAL_ERROR', language_id)
+
+        if params["count_only"]:
+            try:
+                # checking the user with particular rid and user_id exist and getting its current language_id
+                with metrics.phase("user_lookup"):
+                    user_language_id = get_user_language(auth_token, cursor)
+                if user_language_id is None:
+                    return log_err('INVALID_USER', language_id)
+                language_id = user_language_id
+
+                # counting the notifications for the bell badge, nothing is marked visited
+                with metrics.phase("count"):
+                    count = notifications_feed.count_unvisited(cursor, rid, params["since"])
                 return {
                             'statusCode': 200,
                             'headers':{
                                         'Access-Control-Allow-Origin': '*',
                                         'Access-Control-Allow-Credentials': 'true'
                                       },
-                            'body': json.dumps(result_list)
+                            'body': json.dumps({"count":count})
                         }
             except:
-                logger.error(traceback.format_exc())
-                return log_err(config[message_by_language]['EVENT_DATA_STATUS'], 500)
+                logger.exception('INTERNAL_ERROR')
+                return log_err('INTERNAL_ERROR', language_id)
 
+        try:
+            # checking the user exist (unless already confirmed for this token), getting one page of
+            # notification details of the user as a json list (the stored notification json is
+            # spliced in without decoding it) and setting visited status of exactly that page
+            user, rows, body, has_more = notifications_feed.fetch_and_acknowledge(cursor, rid, user_id, params["limit"], params["before"], params["since"], get_cached_user(auth_token))
+            if user is None:
+                return log_err('INVALID_USER', language_id)
+            remember_user(auth_token, user)
+            # keeping the badge of a key-value store in step, MySQL triggers do it themselves
+            notification_badges.get_store().visited(cursor, rid, len(rows))
+            metrics.add("rows", len(rows))
+            metrics.add("payload_bytes", len(body))
+            # getting current language_id of the user
+            language_id = user[0]
         except:
-            logger.error(traceback.format_exc())
-            return log_err(config[message_by_language]['INTERNAL_ERROR'], 500)
-    except:
-        logger.error(traceback.format_exc())
-        return log_err(config[message_by_language]['CONNECTION_STATUS'], 500)
+            logger.exception('INTERNAL_ERROR')
+            return log_err('INTERNAL_ERROR', language_id)
+            
+        try:
+            headers = {
+                        'Access-Control-Allow-Origin': '*',
+                        'Access-Control-Allow-Credentials': 'true',
+                        'Access-Control-Expose-Headers': 'X-Next-Cursor, X-Since-Cursor'
+                      }
+            if has_more:
+                # cursor of the next page of older notifications
+                headers['X-Next-Cursor'] = notifications_feed.encode_cursor(rows[-1][1], rows[-1][0])
+            if params["since"] is not None and (has_more or not rows):
+                # the page holds the newest notifications after since, the unvisited ones between since and
+                # this page are only returned if the client keeps asking from the same since
+                headers['X-Since-Cursor'] = notifications_feed.encode_cursor(*params["since"])
+            elif rows:
+                # cursor to ask only for notifications newer than this page
+                headers['X-Since-Cursor'] = notifications_feed.encode_cursor(rows[0][1], rows[0][0])
+            
+            # preparing success json  with the list of notifications
+            return {
+                        'statusCode': 200,
+                        'headers': headers,
+                        'body': body
+                    }
+        except:
+            logger.exception('EVENT_DATA_STATUS')
+            return log_err('EVENT_DATA_STATUS', language_id)
+    finally:
+        # closing the cursor, the connection stays open for the next invocation
+        db_connection.release_cursor(cursor)
         
 if __name__== "__main__":
     handler(None,None)
@@ -0,0 +1,101 @@
+"""Module to keep the unread badge of every user: its unread count and notification version.
+
+It provides the following functionalities:
+1. MySQLBadgeStore: Badges read from the `notification_badges` table, kept up to date by the
+   triggers of schema/migrations/0004_notification_badges.sql on every change of `notifications`
+2. MemoryBadgeStore: In-process stand-in for a key-value store, for local runs and the harness
+3. get_store(): Getting the store chosen by NOTIFICATION_BADGE_STORE, once per container
+
+A badge is (unread, version). The version grows on every insert, visit or delete of a
+notification of the user, so a client presenting the version it has seen learns that
+nothing changed from one primary key lookup, without reading `notifications`.
+
+NOTIFICATION_BADGE_STORE is `mysql` (default), `memory`, or the dotted path of a class
+(e.g. `badges_redis.RedisBadgeStore`) implementing get(cursor, rid), added(cursor, rid,
+count) and visited(cursor, rid, count). The writers of notifications call added() and the
+handler calls visited(); both do nothing for MySQL, whose triggers do the work.
+"""
+
+import time
+import importlib
+from os import environ
+import notifications_feed
+
+NOTIFICATION_BADGE_STORE = environ.get('NOTIFICATION_BADGE_STORE', 'mysql')
+
+# Query reading the badge of a user (primary key lookup)
+BADGE_QUERY = "SELECT `unread`, `version` FROM `notification_badges` WHERE `rid`=%s"
+
+# store of this container, made on first use
+_store = None
+
+
+class MySQLBadgeStore:
+    """Class reading the badges maintained by the triggers on `notifications`."""
+
+    def get(self, cursor, rid):
+        """Function to get the (unread, version) of the user, (0, 0) if it never had a notification."""
+        cursor.execute(BADGE_QUERY, (rid,))
+        row = cursor.fetchone()
+        if row is None:
+            return 0, 0
+        return int(row[0]), int(row[1])
+
+    def added(self, cursor, rid, count=1):
+        """Function to count new notifications of the user, done by the insert trigger."""
+
+    def visited(self, cursor, rid, count):
+        """Function to uncount visited notifications of the user, done by the update trigger."""
+
+
+class MemoryBadgeStore:
+    """Class keeping the badges in process, standing for a key-value store shared by the writers."""
+
+    def __init__(self):
+        self._badges = {}
+        # versions continue from the clock, so that a new store never repeats a version a client has seen
+        self._last_version = time.time_ns() // 1000
+
+    def _next_version(self):
+        self._last_version += 1
+        return self._last_version
+
+    def get(self, cursor, rid):
+        """Function to get the (unread, version) of the user, counted from `notifications` the first time."""
+        badge = self._badges.get(rid)
+        if badge is None:
+            badge = self._badges[rid] = [notifications_feed.count_unvisited(cursor, rid), self._next_version()]
+        return badge[0], badge[1]
+
+    def added(self, cursor, rid, count=1):
+        """Function to count new unvisited notifications of the user."""
+        badge = self._badges.get(rid)
+        if badge is not None:
+            badge[0] += count
+            badge[1] = self._next_version()
+
+    def visited(self, cursor, rid, count):
+        """Function to uncount notifications of the user that were marked visited."""
+        badge = self._badges.get(rid)
+        if badge is not None and count:
+            badge[0] = max(0, badge[0] - count)
+            badge[1] = self._next_version()
+
+
+STORES = {"mysql": MySQLBadgeStore, "memory": MemoryBadgeStore}
+
+
+def get_store():
+    """Function to get the badge store of this container."""
+    global _store
+    if _store is None:
+        store_class = STORES.get(NOTIFICATION_BADGE_STORE)
+        if store_class is None:
+            # a store of another module, e.g. backed by Redis or DynamoDB
+            module_name, _, class_name = NOTIFICATION_BADGE_STORE.rpartition('.')
+            if not module_name:
+                raise ValueError("NOTIFICATION_BADGE_STORE must be one of %s or a dotted class path"
+                                 % ", ".join(sorted(STORES)))
+            store_class = getattr(importlib.import_module(module_name), class_name)
+        _store = store_class()
+    return _store
@@ -0,0 +1,191 @@
+"""Module to page through the unvisited notifications of a user.
+
+It provides the following functionalities:
+1. parse_feed_params(): Reading limit, before, since, count_only, badge and version from the query string of the request,
+   parse_etag_version() reading the version of an If-None-Match header
+2. encode_cursor() / decode_cursor(): Converting a (timestamp, id) position to the opaque cursor given to clients and back
+3. count_unvisited(): Counting the unvisited notifications, for the bell badge
+4. fetch_page(): Getting one page of unvisited notifications, newest first
+5. mark_visited(): Setting the visited status of the notifications that were returned
+6. fetch_and_acknowledge(): Checking the user, getting and serializing one page and marking exactly that page visited in two statements
+7. build_feed_body(): Serializing a page into the response body, splicing the stored JSON text in once validated
+
+Pages are ordered by (`timestamp`, `id`) descending. A `before` cursor asks for
+the notifications older than the last one of the previous page, a `since`
+cursor for the notifications newer than the newest one the client has seen.
+"""
+
+import json
+import base64
+from os import environ
+from profiles_common import metrics
+
+# number of notifications returned when the request has no limit, and the largest limit accepted
+PAGE_SIZE     = int(environ.get('NOTIFICATIONS_PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = int(environ.get('NOTIFICATIONS_MAX_PAGE_SIZE', '200'))
+
+# conditions selecting the notifications older than / newer than a cursor position,
+# {n} is the table prefix of the notifications columns
+BEFORE_CONDITION = " AND ({n}`timestamp`<%s OR ({n}`timestamp`=%s AND {n}`id`<%s))"
+SINCE_CONDITION  = " AND ({n}`timestamp`>%s OR ({n}`timestamp`=%s AND {n}`id`>%s))"
+
+# page of the notifications of a user together with the check that the user exists, the
+# left join still returns the users row (with NULL notification columns) when nothing is unvisited
+USER_PAGE_QUERY = ("SELECT u.`language_id`, n.`id`, n.`timestamp`, n.`notification_type`, n.`json`"
+                   " FROM `users` u LEFT JOIN `notifications` n ON n.`rid`=u.`id` AND n.`visited`=0{conditions}"
+                   " WHERE u.`id`=%s AND u.`user_id`=%s"
+                   " ORDER BY n.`timestamp` DESC, n.`id` DESC LIMIT %s")
+
+
+def encode_cursor(timestamp, notification_id):
+    """Function to get the opaque cursor of a notification position."""
+    raw = json.dumps([str(timestamp), int(notification_id)]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Function to get the (timestamp, id) position of a cursor, raising ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, notification_id = json.loads(raw)
+        return str(timestamp), int(notification_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid notifications cursor") from e
+
+
+def parse_etag_version(value):
+    """Function to get the badge version of an If-None-Match value, None if it is not one of our ETags."""
+    if not value:
+        return None
+    value = value.strip()
+    # a weak validator (W/"5") added by a proxy or CDN carries the same version
+    if value[:2].upper() == 'W/':
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        return None
+
+
+def parse_feed_params(event):
+    """Function to get the paging parameters of the request, raising ValueError if they are malformed."""
+    params = event.get('queryStringParameters') or {}
+
+    limit = int(params.get('limit') or PAGE_SIZE)
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        raise ValueError("limit must be between 1 and %d" % MAX_PAGE_SIZE)
+
+    before = params.get('before')
+    since = params.get('since')
+    badge = str(params.get('badge', '')).lower() in ('1', 'true')
+    version = None
+    if badge:
+        # badge version the client has seen, also accepted as the ETag it got
+        version = params.get('version')
+        if version:
+            version = int(version)
+        else:
+            headers = event.get('headers') or {}
+            version = parse_etag_version(next((value for name, value in headers.items()
+                                               if name.lower() == 'if-none-match'), None))
+    return {
+        "limit": limit,
+        "before": decode_cursor(before) if before else None,
+        "since": decode_cursor(since) if since else None,
+        "count_only": str(params.get('count_only', '')).lower() in ('1', 'true'),
+        "badge": badge,
+        "version": version,
+    }
+
+
+def _cursor_filter(before, since, prefix=""):
+    """Function to get the SQL conditions and arguments restricting the notifications to the cursors."""
+    conditions, args = "", ()
+    if before is not None:
+        conditions += BEFORE_CONDITION.format(n=prefix)
+        args += (before[0], before[0], before[1])
+    if since is not None:
+        conditions += SINCE_CONDITION.format(n=prefix)
+        args += (since[0], since[0], since[1])
+    return conditions, args
+
+
+def count_unvisited(cursor, rid, since=None):
+    """Function to count the unvisited notifications of the user, newer than since when given."""
+    conditions, args = _cursor_filter(None, since)
+    query = "SELECT COUNT(*) FROM `notifications` WHERE `rid`=%s AND `visited`=0" + conditions
+    cursor.execute(query, (rid,) + args)
+    return cursor.fetchone()[0]
+
+
+def fetch_page(cursor, rid, limit, before=None, since=None):
+    """Function to get up to limit unvisited notifications and whether older ones remain.
+
+    Rows are (`id`, `timestamp`, `notification_type`, `json`) tuples, newest first.
+    """
+    conditions, args = _cursor_filter(before, since)
+    query = ("SELECT `id`, `timestamp`, `notification_type`, `json` FROM `notifications`"
+             " WHERE `rid`=%s AND `visited`=0" + conditions +
+             " ORDER BY `timestamp` DESC, `id` DESC LIMIT %s")
+    # reading one row more than asked to know if there is a next page
+    cursor.execute(query, (rid,) + args + (limit + 1,))
+    rows = cursor.fetchall()
+    return rows[:limit], len(rows) > limit
+
+
+def mark_visited(cursor, rid, notification_ids):
+    """Function to set the visited status of the given notifications of the user only."""
+    if not notification_ids:
+        return 0
+    placeholders = ",".join(["%s"] * len(notification_ids))
+    query = "UPDATE `notifications` SET `visited`=1 WHERE `rid`=%s AND `id` IN (" + placeholders + ")"
+    return cursor.execute(query, (rid,) + tuple(notification_ids))
+
+
+def fetch_and_acknowledge(cursor, rid, user_id, limit, before=None, since=None, user=None):
+    """Function to get the users row, one page of notifications, its response body and whether
+    older ones remain, marking exactly the returned notifications visited.
+
+    The user check is folded into the page query unless the users row is already known, and
+    the UPDATE only names the returned ids, so notifications inserted meanwhile stay unvisited.
+    The body is built before the UPDATE so that a page that cannot be serialized stays unvisited.
+    The users row is None, and nothing is marked, when the user does not exist.
+    """
+    with metrics.phase("select"):
+        if user is None:
+            conditions, args = _cursor_filter(before, since, prefix="n.")
+            cursor.execute(USER_PAGE_QUERY.format(conditions=conditions), args + (rid, user_id, limit + 1))
+            joined = cursor.fetchall()
+            if not joined:
+                return None, [], None, False
+            user = (joined[0][0],)
+            # dropping the users column and the NULL row of a user without unvisited notifications
+            rows = [row[1:] for row in joined if row[1] is not None]
+            rows, has_more = rows[:limit], len(rows) > limit
+        else:
+            rows, has_more = fetch_page(cursor, rid, limit, before, since)
+
+    with metrics.phase("encode"):
+        body = build_feed_body(rows)
+    with metrics.phase("update"):
+        mark_visited(cursor, rid, [row[0] for row in rows])
+    return user, rows, body, has_more
+
+
+def _stored_json(text):
+    """Function to get the stored json text of a notification ready to be spliced into the body,
+    raising ValueError if it is not valid json."""
+    if isinstance(text, (bytes, bytearray)):
+        text = text.decode('utf-8')
+    text = text.strip()
+    # the C decoder validates the whole text (a look at its delimiters would let `{"a":}` through),
+    # only the re-encoding of the former path is saved
+    json.loads(text)
+    return text
+
+
+def build_feed_body(rows):
+    """Function to get the JSON array of the notifications of a page without decoding their json."""
+    return "[" + ", ".join(
+        '{"notification_type": %s, "notification_json": %s}' % (json.dumps(row[2]), _stored_json(row[3]))
+        for row in rows) + "]"
@@ -0,0 +1,6 @@
+"""Shared code for the Profiles Lambda functions.
+
+This package is deployed as a Lambda layer (the ``python/`` directory of
+``ProfilesCommon`` is the layer root), so every function can import it with
+``from profiles_common import ...``.
+"""
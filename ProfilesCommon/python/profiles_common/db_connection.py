@@ -0,0 +1,279 @@
+"""Module to keep one MySQL connection alive across warm Lambda invocations.
+
+It provides the following functionalities:
+1. make_connection(): Connecting to the Database (or one of its replicas) using connection details received through environment variables
+2. get_connection(): Returning the container's connection, revalidating it when it has been idle and reconnecting when it is stale or broken
+3. open_cursor(): Getting a cursor on the container's connection
+4. replica_lag(): Getting the replication lag of a replica connection in seconds
+5. get_read_connection(): Returning the container's replica connection, or the primary one when no replica is usable
+6. open_read_cursor(): Getting a cursor for reads that may lag behind the primary by up to REPLICA_MAX_LAG seconds
+7. release_cursor(): Closing a cursor and dropping the connection if its socket broke while it was in use
+8. close_connection() / close_read_connection(): Closing the container's connections
+9. connection_stats(): Returning the opened / reused / reconnected and replica counters of this container
+
+Every increment of a counter is also added to the metrics of the current request
+(profiles_common.metrics) as a db_<counter> count, e.g. db_opened or db_reconnected.
+
+Pure reads can be sent to read replicas listed in REPLICA_ENDPOINTS (comma separated
+host or host:port). A container keeps one replica connection, chosen when it connects
+by REPLICA_SELECTION: `round_robin` (the next replica, from a random first one so that
+containers spread over the replicas) or `least_latency` (the replica with the fastest
+lag checks seen by this container, unmeasured replicas first). Every
+REPLICA_LAG_CHECK_INTERVAL seconds the replica's lag is read (which also proves the
+connection alive); a replica that cannot be reached, is not replicating or lags more
+than REPLICA_MAX_LAG seconds is skipped for REPLICA_RETRY_AFTER seconds and the reads
+go to another replica or to the primary. Writes and reads that must see them use
+open_cursor(), which always uses the primary.
+"""
+
+import time
+import random
+import logging
+from os import environ
+from profiles_common import metrics
+
+# Getting the DB details from the environment variables to connect to DB
+endpoint = environ.get('ENDPOINT')
+port     = environ.get('PORT')
+dbuser   = environ.get('DBUSER')
+password = environ.get('DBPASSWORD')
+database = environ.get('DATABASE')
+
+# seconds a connection may stay idle before it is pinged again on reuse
+PING_INTERVAL = float(environ.get('DB_PING_INTERVAL', '30'))
+# seconds to wait for the TCP + auth handshake
+CONNECT_TIMEOUT = int(environ.get('DB_CONNECT_TIMEOUT', '5'))
+
+# read replicas, and how they are chosen and checked
+REPLICA_ENDPOINTS = [host.strip() for host in environ.get('REPLICA_ENDPOINTS', '').split(',') if host.strip()]
+REPLICA_SELECTION = environ.get('REPLICA_SELECTION', 'round_robin')
+REPLICA_MAX_LAG = float(environ.get('REPLICA_MAX_LAG', '5'))
+REPLICA_LAG_CHECK_INTERVAL = float(environ.get('REPLICA_LAG_CHECK_INTERVAL', '10'))
+REPLICA_RETRY_AFTER = float(environ.get('REPLICA_RETRY_AFTER', '30'))
+# query returning the lag in seconds as its first column, e.g. from a heartbeat table or
+# information_schema.replica_host_status on Aurora, SHOW REPLICA STATUS when not set
+REPLICA_LAG_QUERY = environ.get('REPLICA_LAG_QUERY')
+
+if REPLICA_SELECTION not in ('round_robin', 'least_latency'):
+    raise ValueError("REPLICA_SELECTION must be round_robin or least_latency")
+
+logger = logging.getLogger()
+
+# connection shared by every invocation served by this container
+_connection = None
+# monotonic time at which the connection was last handed out
+_last_used = 0.0
+
+# replica connection of this container, its endpoint and the monotonic time of its last lag check
+_replica = None
+_replica_endpoint = None
+_replica_checked = 0.0
+# endpoint -> monotonic time until which the replica is skipped
+_replica_down = {}
+# endpoint -> moving average of the lag check round trip in seconds, for least_latency
+_replica_latency = {}
+# index of the next replica for round_robin, a random start spreads the containers
+_next_replica = random.randrange(len(REPLICA_ENDPOINTS)) if REPLICA_ENDPOINTS else 0
+
+# counters of this container to see how often connections are reused, each request also
+# reports its own increments as db_<counter> metrics counts
+stats = {"opened": 0, "reused": 0, "reconnected": 0,
+         "replica_opened": 0, "replica_reads": 0, "primary_fallbacks": 0}
+
+
+def _count(name):
+    """Function to increment a connection counter of the container and of the current request."""
+    stats[name] += 1
+    metrics.add("db_" + name, 1)
+
+
+def make_connection(host=None):
+    """Function to make the database connection, to the primary unless a replica host[:port] is given."""
+    # imported on first connection, a container served from its caches never loads it
+    import pymysql
+    host_port = port
+    if host is None:
+        host = endpoint
+    elif ':' in host:
+        host, host_port = host.split(':', 1)
+    return pymysql.connect(host=host, user=dbuser, passwd=password,
+        port=int(host_port), db=database, autocommit=True, connect_timeout=CONNECT_TIMEOUT)
+
+
+def close_connection():
+    """Function to close the connection held by the container."""
+    global _connection
+    cnx, _connection = _connection, None
+    if cnx is not None:
+        try:
+            cnx.close()
+        except:
+            # the socket is already gone, nothing left to release
+            pass
+
+
+def get_connection():
+    """Function to get the container's connection, reconnecting if it is not usable."""
+    global _connection, _last_used
+    now = time.monotonic()
+
+    if _connection is None:
+        # first invocation of this container
+        _connection = make_connection()
+        _count("opened")
+    elif not _connection.open:
+        # socket was closed by an error in an earlier invocation
+        close_connection()
+        _connection = make_connection()
+        _count("reconnected")
+    elif now - _last_used > PING_INTERVAL:
+        # connection has been idle long enough to be killed by wait_timeout
+        try:
+            _connection.ping(reconnect=False)
+            _count("reused")
+        except:
+            logger.info("Stale DB connection, reconnecting.")
+            close_connection()
+            _connection = make_connection()
+            _count("reconnected")
+    else:
+        _count("reused")
+
+    _last_used = now
+    return _connection
+
+
+def open_cursor():
+    """Function to get a cursor on the container's connection."""
+    return get_connection().cursor()
+
+
+def replica_lag(cnx):
+    """Function to get the replication lag of a replica connection in seconds, None if it is not replicating."""
+    cursor = cnx.cursor()
+    try:
+        cursor.execute(REPLICA_LAG_QUERY or "SHOW REPLICA STATUS")
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        if REPLICA_LAG_QUERY:
+            lag = row[0]
+        else:
+            names = [column[0] for column in cursor.description]
+            # MySQL before 8.0.22 names the column after the master
+            column = 'Seconds_Behind_Source' if 'Seconds_Behind_Source' in names else 'Seconds_Behind_Master'
+            lag = row[names.index(column)]
+        return None if lag is None else float(lag)
+    finally:
+        cursor.close()
+
+
+def _replica_usable(cnx, host):
+    """Function to check the lag of a replica, timing the check for least_latency."""
+    start = time.monotonic()
+    lag = replica_lag(cnx)
+    elapsed = time.monotonic() - start
+    previous = _replica_latency.get(host)
+    _replica_latency[host] = elapsed if previous is None else 0.8 * previous + 0.2 * elapsed
+    if lag is None or lag > REPLICA_MAX_LAG:
+        logger.warning("Replica %s lags %s seconds, reads go elsewhere.", host, lag)
+        return False
+    return True
+
+
+def _replica_candidates(now):
+    """Function to get the replicas to try in order, the ones marked down excepted."""
+    global _next_replica
+    hosts = [host for host in REPLICA_ENDPOINTS if _replica_down.get(host, 0.0) <= now]
+    if REPLICA_SELECTION == 'least_latency':
+        # unmeasured replicas first, then the fastest
+        return sorted(hosts, key=lambda host: _replica_latency.get(host, -1.0))
+    start = _next_replica % len(REPLICA_ENDPOINTS)
+    _next_replica += 1
+    ordered = REPLICA_ENDPOINTS[start:] + REPLICA_ENDPOINTS[:start]
+    return [host for host in ordered if host in hosts]
+
+
+def close_read_connection():
+    """Function to close the replica connection held by the container."""
+    global _replica, _replica_endpoint
+    cnx, _replica, _replica_endpoint = _replica, None, None
+    if cnx is not None:
+        try:
+            cnx.close()
+        except:
+            pass
+
+
+def _connect_replica(now):
+    """Function to connect to the first usable replica, None if there is none."""
+    global _replica, _replica_endpoint, _replica_checked
+    for host in _replica_candidates(now):
+        cnx = None
+        try:
+            cnx = make_connection(host)
+            if _replica_usable(cnx, host):
+                _replica, _replica_endpoint, _replica_checked = cnx, host, now
+                _count("replica_opened")
+                return cnx
+        except:
+            logger.warning("Replica %s is not reachable, reads go elsewhere.", host, exc_info=True)
+        _replica_down[host] = now + REPLICA_RETRY_AFTER
+        if cnx is not None:
+            try:
+                cnx.close()
+            except:
+                pass
+    return None
+
+
+def get_read_connection():
+    """Function to get the container's replica connection, the primary one when no replica is usable."""
+    global _replica_checked
+    if not REPLICA_ENDPOINTS:
+        return get_connection()
+    now = time.monotonic()
+
+    if _replica is not None and (not _replica.open or now - _replica_checked > REPLICA_LAG_CHECK_INTERVAL):
+        # the lag check also proves that the connection still works
+        host = _replica_endpoint
+        try:
+            usable = _replica.open and _replica_usable(_replica, host)
+        except:
+            logger.warning("Replica %s connection broke, reconnecting.", host, exc_info=True)
+            usable = False
+        if usable:
+            _replica_checked = now
+        else:
+            close_read_connection()
+            _replica_down[host] = now + REPLICA_RETRY_AFTER
+
+    cnx = _replica if _replica is not None else _connect_replica(now)
+    if cnx is None:
+        _count("primary_fallbacks")
+        return get_connection()
+    _count("replica_reads")
+    return cnx
+
+
+def open_read_cursor():
+    """Function to get a cursor for pure reads, on a replica when one is usable."""
+    return get_read_connection().cursor()
+
+
+def release_cursor(cursor):
+    """Function to close the cursor and drop the connection if it broke while in use."""
+    try:
+        cursor.close()
+    except:
+        pass
+    if _connection is not None and not _connection.open:
+        close_connection()
+    if _replica is not None and not _replica.open:
+        close_read_connection()
+    logger.debug("DB connection stats: %s", stats)
+
+
+def connection_stats():
+    """Function to get a copy of the connection counters of this container."""
+    return dict(stats)
@@ -0,0 +1,84 @@
+"""Module to verify authorization tokens, caching the results per container.
+
+It provides the following functionalities:
+1. jwt_verify(): verifying token and fetching data from the jwt token sent by user
+2. get_user_language(): Getting the language_id of the user of a verified token from the users table
+3. get_cached_user() / remember_user(): Reading and storing the confirmed users row of a token,
+   for handlers that check the user as part of another query
+
+Clients poll with the same token many times per minute, so each verified token is
+kept in an LRU cache keyed by its SHA-256 digest until the token's exp or
+JWT_CACHE_TTL seconds, whichever comes first. The entry also remembers the
+confirmed users row, so repeat requests skip both the signature check and the
+users lookup. Tokens that fail verification are never cached.
+"""
+
+import time
+import hashlib
+from os import environ
+from profiles_common.ttl_cache import TTLCache
+
+# secret key for the security token
+SECRET_KEY = environ.get('TOKEN_SECRET_KEY')
+
+# query to check that the user exists and to get its current language (primary key lookup)
+USER_LANGUAGE_QUERY = "SELECT `language_id` FROM `users` WHERE `id`=%s AND `user_id`=%s"
+
+# verified tokens, digest -> {"claims": (rid, user_id, language_id), "user": confirmed users row or None}
+token_cache = TTLCache(int(environ.get('JWT_CACHE_SIZE', '1024')),
+                       float(environ.get('JWT_CACHE_TTL', '60')))
+
+
+def _token_entry(auth_token):
+    """Function to get the cache entry of a token, verifying it on a miss."""
+    digest = hashlib.sha256(auth_token.encode('utf-8')).digest()
+    entry = token_cache.get(digest)
+    if entry is not None:
+        return entry
+
+    # imported on the first cache miss only
+    import jwt
+    # decoding the authorization token provided by user
+    payload = jwt.decode(auth_token, SECRET_KEY, options={'require_exp': True})
+
+    # setting the required values in return
+    rid = int(payload['id'])
+    user_id = payload['user_id']
+    language_id = payload['language_id']
+
+    entry = {"claims": (rid, user_id, language_id), "user": None}
+    # never keeping the token beyond its own expiry
+    token_cache.set(digest, entry, ttl=float(payload['exp']) - time.time())
+    return entry
+
+
+def jwt_verify(auth_token):
+    """Function to verify the authorization token"""
+    return _token_entry(auth_token)["claims"]
+
+
+def get_cached_user(auth_token):
+    """Function to get the confirmed users row (`language_id`,) of the token, None if it was not confirmed yet."""
+    return _token_entry(auth_token)["user"]
+
+
+def remember_user(auth_token, user):
+    """Function to store the confirmed users row (`language_id`,) of the token."""
+    _token_entry(auth_token)["user"] = user
+
+
+def get_user_language(auth_token, cursor):
+    """Function to get the language_id of the token's user, None if the user does not exist."""
+    entry = _token_entry(auth_token)
+    if entry["user"] is not None:
+        return entry["user"][0]
+
+    rid, user_id, _ = entry["claims"]
+    # checking that the user exists and getting its current language
+    cursor.execute(USER_LANGUAGE_QUERY, (rid, user_id))
+    result = cursor.fetchone()
+    if result is None:
+        return None
+
+    entry["user"] = result
+    return result[0]
@@ -0,0 +1,32 @@
+"""Module listing the heavy dependencies that the handlers import lazily.
+
+It provides the following functionalities:
+1. HEAVY_MODULES: Modules only imported inside the functions of the code paths that use them
+2. preload(): Importing them ahead of traffic, e.g. when a container is warmed up
+3. loaded(): Returning which of them are already imported in this container
+
+pymysql is imported by db_connection.make_connection(), jwt by a jwt_auth cache
+miss and boto3 / botocore by the functions making AWS clients.
+"""
+
+import sys
+import importlib
+
+HEAVY_MODULES = ('pymysql', 'jwt', 'boto3', 'botocore.client')
+
+
+def preload(names=HEAVY_MODULES):
+    """Function to import the given modules, skipping the ones not installed in this function."""
+    imported = []
+    for name in names:
+        try:
+            importlib.import_module(name)
+            imported.append(name)
+        except ImportError:
+            pass
+    return imported
+
+
+def loaded(names=HEAVY_MODULES):
+    """Function to get the given modules that are already imported."""
+    return [name for name in names if name in sys.modules]
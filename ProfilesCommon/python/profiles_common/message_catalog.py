@@ -0,0 +1,105 @@
+"""Module to compile the response messages of a handler into per-language tables.
+
+It provides the following functionalities:
+1. MessageCatalog: The messages of a `.properties` file, parsed once per container, with the
+   JSON body of every message and the error response of every message already built
+2. MessageCatalog.message(): Getting the text of a message in a language
+3. MessageCatalog.body(): Getting the JSON body {"message": ...} of a message in a language
+4. MessageCatalog.error(): Getting the error response of a message in a language
+
+The sections of the file are named `<language_id>_MESSAGES`. A language missing a message
+falls back to DEFAULT_LANGUAGE_ID, and an unknown (or not yet known) language uses the
+tables of DEFAULT_LANGUAGE_ID, so the lookups never fail once the catalog is compiled.
+The language is passed with every lookup, as an int or a numeric string (the language_id
+claim of a token), nothing is kept between requests.
+"""
+
+import json
+import configparser
+from types import MappingProxyType
+
+# language of the messages used when the language of a request is unknown
+DEFAULT_LANGUAGE_ID = 165
+
+# headers of every prebuilt error response
+ERROR_HEADERS = MappingProxyType({
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Credentials': 'true',
+})
+
+SECTION_SUFFIX = "_MESSAGES"
+
+
+class MessageCatalog:
+    """Class holding the compiled messages of one handler."""
+
+    def __init__(self, path, status_codes=None, default_status=500, default_language_id=DEFAULT_LANGUAGE_ID,
+                 encoding="ISO-8859-1"):
+        """Function to compile the messages of the file at path.
+
+        status_codes maps a message key to the status code of its error response,
+        the other keys use default_status.
+        """
+        config = configparser.ConfigParser(interpolation=None)
+        # keeping the keys as they are written, e.g. CONNECTION_STATUS
+        config.optionxform = str
+        # a missing file raises here instead of leaving the handler without messages
+        with open(path, encoding=encoding) as properties:
+            config.read_file(properties)
+
+        texts = {}
+        for section in config.sections():
+            if section.endswith(SECTION_SUFFIX):
+                texts[int(section[:-len(SECTION_SUFFIX)])] = dict(config[section])
+        if default_language_id not in texts:
+            raise ValueError("%s has no %d%s section" % (path, default_language_id, SECTION_SUFFIX))
+
+        status_codes = status_codes or {}
+        self.default_language_id = default_language_id
+        self._messages = {}
+        self._bodies = {}
+        self._errors = {}
+        for language_id, messages in texts.items():
+            # messages missing in a language fall back to the default language
+            messages = dict(texts[default_language_id], **messages)
+            bodies = {key: json.dumps({"message": text}) for key, text in messages.items()}
+            self._messages[language_id] = MappingProxyType(messages)
+            self._bodies[language_id] = MappingProxyType(bodies)
+            self._errors[language_id] = MappingProxyType({
+                key: MappingProxyType({
+                    "statusCode": status_codes.get(key, default_status),
+                    "body": body,
+                    "headers": ERROR_HEADERS,
+                    "isBase64Encoded": "false",
+                })
+                for key, body in bodies.items()
+            })
+        self._default_errors = self._errors[default_language_id]
+
+    def _language(self, language_id):
+        """Function to get the table key of a language_id given as an int or a string, None if it is not one."""
+        if isinstance(language_id, int):
+            return language_id
+        try:
+            # the language_id claim of a token may be a string, e.g. "245"
+            return int(language_id)
+        except (TypeError, ValueError):
+            return None
+
+    def languages(self):
+        """Function to get the language_ids the catalog has messages for."""
+        return sorted(self._messages)
+
+    def message(self, key, language_id=None):
+        """Function to get the text of a message in the language, or in the default one."""
+        return self._messages.get(self._language(language_id), self._messages[self.default_language_id])[key]
+
+    def body(self, key, language_id=None):
+        """Function to get the serialized {"message": ...} body of a message."""
+        return self._bodies.get(self._language(language_id), self._bodies[self.default_language_id])[key]
+
+    def error(self, key, language_id=None):
+        """Function to get the error response of a message, ready to be returned by a handler."""
+        response = self._errors.get(self._language(language_id), self._default_errors)[key]
+        # the compiled response stays untouched whatever the caller does with its copy
+        return dict(response, headers=dict(ERROR_HEADERS))
@@ -0,0 +1,157 @@
+"""Module to time the phases of a request and emit them as CloudWatch Embedded Metric Format.
+
+It provides the following functionalities:
+1. instrumented(): Decorator measuring a handler invocation, with its cold/warm flag and status code
+2. phase(): Context manager adding the time spent in a block to a phase of the current request
+3. add(): Adding to a count metric of the current request, e.g. rows or payload bytes
+4. set_sink(): Replacing where the records go, e.g. a list when benchmarking locally
+
+METRICS_SINK selects the sink: "off" (default), "emf" (one JSON line per request on
+stdout, which Lambda ships to CloudWatch Logs where it becomes metrics) or "log"
+(the same line through the logger). When metrics are off, phase() hands out a
+shared no-op context manager and add() returns at once.
+"""
+
+import sys
+import json
+import time
+import logging
+import functools
+from os import environ
+
+METRICS_SINK = environ.get('METRICS_SINK', 'off')
+NAMESPACE = environ.get('METRICS_NAMESPACE', 'Profiles')
+
+logger = logging.getLogger()
+
+
+def _emf_sink(record):
+    """Function to write a record as one line on stdout."""
+    sys.stdout.write(json.dumps(record, separators=(',', ':')) + "\n")
+
+
+def _log_sink(record):
+    """Function to write a record through the logger."""
+    # every request has its record, log sampling does not apply
+    logger.info(json.dumps(record, separators=(',', ':')), extra={"no_sample": True})
+
+
+SINKS = {"off": None, "emf": _emf_sink, "log": _log_sink}
+if METRICS_SINK not in SINKS:
+    raise ValueError("METRICS_SINK must be one of %s" % ", ".join(sorted(SINKS)))
+
+# where the records go, None when metrics are off
+_sink = SINKS[METRICS_SINK]
+# True until the container served its first request
+_cold = True
+# metrics of the request being served, a container serves one request at a time
+_current = None
+
+
+class _NoopPhase:
+    """Class of the context manager handed out when no request is measured."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_PHASE = _NoopPhase()
+
+
+class _Phase:
+    """Class of the context manager timing one phase of a request."""
+
+    __slots__ = ("timings", "name", "start")
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings[self.name] = self.timings.get(self.name, 0.0) + (time.perf_counter() - self.start) * 1000
+        return False
+
+
+class RequestMetrics:
+    """Class holding the phases, counts and properties of one request."""
+
+    def __init__(self, function_name, cold_start):
+        self.function_name = function_name
+        self.cold_start = cold_start
+        self.timings = {}
+        self.counts = {}
+        self.properties = {}
+
+    def to_emf(self):
+        """Function to get the request as an Embedded Metric Format record."""
+        metrics = [{"Name": name + "_ms", "Unit": "Milliseconds"} for name in self.timings]
+        metrics += [{"Name": name, "Unit": "Bytes" if name.endswith("_bytes") else "Count"} for name in self.counts]
+        metrics.append({"Name": "cold_start", "Unit": "Count"})
+        record = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{"Namespace": NAMESPACE, "Dimensions": [["Function"]], "Metrics": metrics}],
+            },
+            "Function": self.function_name,
+            "cold_start": int(self.cold_start),
+        }
+        record.update(self.properties)
+        for name, value in self.timings.items():
+            record[name + "_ms"] = round(value, 3)
+        record.update(self.counts)
+        return record
+
+
+def set_sink(sink):
+    """Function to send the records to the given callable, None turns metrics off."""
+    global _sink
+    _sink = sink
+
+
+def phase(name):
+    """Function to get a context manager adding the time of its block to the named phase."""
+    if _current is None:
+        return _NOOP_PHASE
+    return _Phase(_current.timings, name)
+
+
+def add(name, value):
+    """Function to add the value to the named count of the current request."""
+    if _current is not None:
+        _current.counts[name] = _current.counts.get(name, 0) + value
+
+
+def instrumented(function_name):
+    """Function to get a decorator measuring every invocation of a handler."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            global _cold, _current
+            cold_start, _cold = _cold, False
+            if _sink is None:
+                return handler(event, context)
+
+            _current = request = RequestMetrics(function_name, cold_start)
+            start = time.perf_counter()
+            try:
+                response = handler(event, context)
+                if isinstance(response, dict):
+                    request.properties["StatusCode"] = response.get("statusCode", response.get("status_code"))
+                return response
+            finally:
+                request.timings["total"] = (time.perf_counter() - start) * 1000
+                _current = None
+                try:
+                    _sink(request.to_emf())
+                except Exception:
+                    # metrics must never fail the request
+                    logger.warning("Could not emit metrics", exc_info=True)
+        return wrapper
+    return decorator
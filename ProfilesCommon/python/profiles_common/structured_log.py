@@ -0,0 +1,123 @@
+"""Module to log compact JSON lines, with credentials redacted and verbose records sampled.
+
+It provides the following functionalities:
+1. redact(): Copying a value (event, headers, response, ...) with its credentials replaced
+2. RecordFilter: Keeping LOG_SAMPLE_RATE of the INFO records and LOG_DEBUG_SAMPLE_RATE of the DEBUG
+   ones, and redacting the message and arguments of the records kept
+3. JsonFormatter: Formatting a record as one JSON line, its message only built when it is emitted
+4. install(): Setting the filter (and formatter) on the handlers of a logger (the root logger of a function)
+
+Records below the level of the logger cost nothing, and sampled out records are
+dropped before they are formatted: the message arguments (e.g. a whole event) are
+only redacted and formatted for the records actually written. WARNING and above are
+never sampled, nor are records logged with extra={"no_sample": True}. Exceptions are
+written as their type, message and last LOG_STACK_FRAMES frames, without reading the
+source lines a full traceback would print. LOG_FORMAT=text keeps the plain log lines,
+still sampled and redacted.
+"""
+
+import os
+import re
+import sys
+import json
+import random
+import logging
+import traceback
+from os import environ
+
+LOG_FORMAT = environ.get('LOG_FORMAT', 'json')
+SAMPLE_RATE = float(environ.get('LOG_SAMPLE_RATE', '1'))
+DEBUG_SAMPLE_RATE = float(environ.get('LOG_DEBUG_SAMPLE_RATE', '1'))
+STACK_FRAMES = int(environ.get('LOG_STACK_FRAMES', '8'))
+
+REDACTED = "[REDACTED]"
+# keys whose values are never written, matched on the lower case key
+SENSITIVE_WORDS = ('authorization', 'cookie', 'token', 'secret', 'password', 'api-key', 'api_key', 'credential')
+# JSON web tokens found inside strings
+JWT_PATTERN = re.compile(r'eyJ[\w-]+\.[\w-]+\.[\w-]*')
+
+# json.dumps options of the log lines
+_SEPARATORS = (',', ':')
+
+
+def _is_sensitive(key):
+    """Function to check whether the value of a key must be redacted."""
+    key = key.lower()
+    return any(word in key for word in SENSITIVE_WORDS)
+
+
+def redact(value):
+    """Function to get a copy of the value with its credentials replaced by [REDACTED]."""
+    if isinstance(value, dict):
+        return {key: REDACTED if isinstance(key, str) and _is_sensitive(key) else redact(item)
+                for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, str) and 'eyJ' in value:
+        return JWT_PATTERN.sub(REDACTED, value)
+    return value
+
+
+class RecordFilter(logging.Filter):
+    """Class keeping a share of the INFO and DEBUG records, and all the other ones, redacted."""
+
+    def __init__(self, rate=SAMPLE_RATE, debug_rate=DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+        self.debug_rate = debug_rate
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING and not getattr(record, 'no_sample', False):
+            rate = self.debug_rate if record.levelno < logging.INFO else self.rate
+            if rate < 1 and random.random() >= rate:
+                return False
+        # only the records kept are redacted
+        if not getattr(record, 'redacted', False):
+            record.msg = redact(record.msg)
+            if isinstance(record.args, dict):
+                record.args = redact(record.args)
+            elif record.args:
+                record.args = tuple(redact(arg) for arg in record.args)
+            record.redacted = True
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Class formatting records as one compact JSON object per line."""
+
+    def format(self, record):
+        if isinstance(record.msg, (dict, list, tuple)) and not record.args:
+            # structures are written as JSON, not as their repr
+            message = record.msg
+        else:
+            message = record.getMessage()
+            if 'eyJ' in message:
+                message = JWT_PATTERN.sub(REDACTED, message)
+
+        line = {"level": record.levelname, "msg": message}
+        # added to the records by the Lambda runtime
+        request_id = getattr(record, 'aws_request_id', None)
+        if request_id:
+            line["request_id"] = request_id
+        if record.exc_info and record.exc_info[0] is not None:
+            exc_type, exc, tb = record.exc_info
+            line["exc_type"] = exc_type.__name__
+            line["exc"] = redact(str(exc))
+            frames = traceback.StackSummary.extract(traceback.walk_tb(tb), lookup_lines=False)
+            line["stack"] = ["%s:%d:%s" % (os.path.basename(frame.filename), frame.lineno, frame.name)
+                             for frame in frames[-STACK_FRAMES:]]
+        return json.dumps(line, separators=_SEPARATORS, default=str, ensure_ascii=False)
+
+
+def install(logger=None):
+    """Function to make the handlers of the logger write sampled, redacted (JSON) lines."""
+    logger = logger if logger is not None else logging.getLogger()
+    if not logger.handlers:
+        # outside of Lambda, whose runtime installs its own handler on the root logger
+        logger.addHandler(logging.StreamHandler(sys.stdout))
+    for handler in logger.handlers:
+        if LOG_FORMAT == 'json' and not isinstance(handler.formatter, JsonFormatter):
+            handler.setFormatter(JsonFormatter())
+        if not any(isinstance(existing, RecordFilter) for existing in handler.filters):
+            handler.addFilter(RecordFilter())
+    return logger
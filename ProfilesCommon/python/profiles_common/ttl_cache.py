@@ -0,0 +1,61 @@
+"""Module providing a small in-process cache for warm Lambda containers.
+
+It provides the following functionalities:
+1. TTLCache: Bounded mapping whose entries expire after a time to live and
+   which evicts the least recently used entry when it is full
+
+A Lambda container serves one invocation at a time, so the cache is not locked.
+"""
+
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Class holding at most ``maxsize`` entries for ``ttl`` seconds each."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (expiry time, value), ordered from least to most recently used
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Function to get a live entry, counting the lookup as a hit or a miss."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            # entry expired, dropping it
+            del self._entries[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        """Function to store an entry, optionally with a shorter time to live."""
+        if ttl is None or ttl > self.ttl:
+            ttl = self.ttl
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        # evicting least recently used entries above the size bound
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key):
+        """Function to drop an entry if it is present."""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """Function to drop every entry."""
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Function to get the size and the hit / miss counters of the cache."""
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,137 @@
+"""Module answering the pings of the Lambda warmer by priming the container.
+
+It provides the following functionalities:
+1. is_warmup(): Checking that an event is a warmer ping ({"source": "lambda_warmer"})
+2. get_lambda_client(): Making the boto3 lambda client used to fan the ping out, once per container
+3. fan_out(): Invoking the function again (asynchronously) so that more containers are warmed at once
+4. handle(): Answering a ping: importing the lazy modules, opening and validating the DB
+   connections (primary and replica), priming the handler's caches and reporting what was done
+
+A ping may carry `concurrency` (containers to warm, at most WARMUP_MAX_CONCURRENCY) and
+`delay_ms` (how long each ping keeps its container busy, default WARMUP_DELAY_MS). The
+first ping invokes the function concurrency - 1 more times; since every ping holds its
+container for delay_ms, the invocations cannot be served by the same container and
+Lambda starts (and so warms) a new one for each of them. Every step is best effort, a
+failing step is reported in the response and never fails the ping.
+"""
+
+import json
+import time
+import logging
+from os import environ
+from concurrent.futures import ThreadPoolExecutor
+from profiles_common import db_connection, lazy_imports
+
+WARMER_SOURCE = "lambda_warmer"
+
+# upper bound of the containers warmed by one ping
+MAX_CONCURRENCY = int(environ.get('WARMUP_MAX_CONCURRENCY', '50'))
+# milliseconds each ping of a fan-out keeps its container busy
+DELAY_MS = int(environ.get('WARMUP_DELAY_MS', '75'))
+
+# aws cridentials required for creating boto3 client object
+AWS_REGION = environ.get('REGION')
+AWS_ACCESS_KEY = environ.get('ACCESS_KEY_ID')
+AWS_SECRET = environ.get('SECRET_ACCESS_KEY')
+
+logger = logging.getLogger()
+
+# boto3 lambda client, created by the first ping that fans out
+lambda_client = None
+
+
+def is_warmup(event):
+    """Function to check whether the event is a ping of the lambda warmer."""
+    return isinstance(event, dict) and event.get('source') == WARMER_SOURCE
+
+
+def get_lambda_client():
+    """Function to get the boto3 lambda client of this container."""
+    global lambda_client
+    if lambda_client is None:
+        # boto3 is only imported by the pings that fan out
+        import boto3
+        lambda_client = boto3.client(
+                                    "lambda",
+                                    region_name=AWS_REGION,
+                                    aws_access_key_id=AWS_ACCESS_KEY,
+                                    aws_secret_access_key=AWS_SECRET
+                                )
+    return lambda_client
+
+
+def fan_out(function_name, concurrency, delay_ms):
+    """Function to invoke the function concurrency - 1 times asynchronously, returning the number of invocations sent."""
+    if concurrency <= 1:
+        return 0
+    client = get_lambda_client()
+
+    def invoke(index):
+        # the pings of a fan-out carry their index and never fan out again
+        payload = {"source": WARMER_SOURCE, "concurrency": concurrency, "delay_ms": delay_ms, "warmer_index": index}
+        client.invoke(FunctionName=function_name, InvocationType="Event", Payload=json.dumps(payload))
+
+    with ThreadPoolExecutor(max_workers=min(concurrency - 1, 10)) as pool:
+        list(pool.map(invoke, range(1, concurrency)))
+    return concurrency - 1
+
+
+def _prime_connection(prime):
+    """Function to open and validate the DB connections, then prime the caches with a read cursor."""
+    cursor = db_connection.open_cursor()
+    try:
+        # a round trip proves the connection (and its credentials) really work
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+    finally:
+        db_connection.release_cursor(cursor)
+    # a handler without caches (delete-picture) never opens a replica connection
+    if prime is None:
+        return
+    # the caches only hold reads, primed from a replica when one is usable
+    cursor = db_connection.open_read_cursor()
+    try:
+        prime(cursor)
+    finally:
+        db_connection.release_cursor(cursor)
+
+
+def handle(event, context, prime=None):
+    """Function to answer a warmer ping, prime(cursor) filling the caches of the handler."""
+    start = time.perf_counter()
+    try:
+        concurrency = max(1, min(int(event.get('concurrency', 1)), MAX_CONCURRENCY))
+        delay_ms = int(event.get('delay_ms', DELAY_MS))
+    except (TypeError, ValueError):
+        # a malformed ping still warms this container
+        concurrency, delay_ms = 1, DELAY_MS
+    report = {"message": "lambda warmed", "warmer_index": event.get('warmer_index', 0)}
+
+    if concurrency > 1 and 'warmer_index' not in event:
+        try:
+            # the qualified ARN warms the same version / alias as the one pinged
+            report["fanned_out"] = fan_out(context.invoked_function_arn, concurrency, delay_ms)
+        except:
+            logger.exception("Warm-up fan out failed")
+            report["fanned_out"] = 0
+
+    report["imported"] = lazy_imports.preload()
+    try:
+        _prime_connection(prime)
+        report["primed"] = True
+    except:
+        logger.exception("Warm-up priming failed")
+        report["primed"] = False
+    report["connections"] = db_connection.connection_stats()
+
+    if concurrency > 1:
+        # keeping the container busy so that the other pings land on other containers
+        remaining = delay_ms / 1000.0 - (time.perf_counter() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+    report["warm_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    logger.info("lambda warmed %s", report)
+    return {
+        'statusCode': 200,
+        'body': json.dumps(report)
+    }
@@ -1,157 +1,119 @@
 """API For deleting user profile picture.
 
 It provides the following functionalities:
-1. make_connection(): Connecting to the Database using connection details received through environment variables
-2. log_err(): Logging error and returning the JSON response with error message & status code
-3. jwt_verify(): verifying token and fetching data from the jwt token sent by user
-4. delete_image_s3(): Function for deleting image to aws S3 bucket
-5. handler(): Handling the incoming request with following steps:
+1. log_err(): Logging error and returning the prebuilt JSON response with error message & status code
+2. handler(): Handling the incoming request with following steps:
 - Fetching data from request
-- deleting profile picture of the user
+- deleting profile picture of the user, the S3 object is queued in the `picture_deletions`
+  outbox in the same transaction and deleted later by picture_deletions.drain_handler
 - Returning the JSON response with success status code with the message ,authentication token and user_id in the response body
+
+The DB connection is shared between warm invocations through profiles_common.db_connection
+and tokens are verified (and their users confirmed) through the cache of profiles_common.jwt_auth.
+The user lookup stays on the primary connection of the update, so that a container of this rarely
+called function holds one DB connection even when read replicas are configured.
+The time spent in each phase is recorded through profiles_common.metrics.
+The response messages are compiled once per container by profiles_common.message_catalog
+and the language of a request is only kept in the handler's local variables.
+Logs are written as sampled, redacted JSON lines by profiles_common.structured_log.
+Pings of the lambda warmer are answered by profiles_common.warmup, which primes the container.
 """
 
-import jwt
-import json
-import pymysql
 import logging
-import traceback
 from os import environ
-import configparser
-import boto3
-from botocore.client import Config
-
-# reading values from property file to get all the response messages
-config = configparser.ConfigParser()
-config.read('deletepicture.properties', encoding = "ISO-8859-1")
+from os.path import dirname, join
+from profiles_common import db_connection, metrics, warmup, structured_log
+from profiles_common.message_catalog import MessageCatalog
+from profiles_common.jwt_auth import jwt_verify, get_user_language
+import picture_deletions
 
-# Getting the DB details from the environment variables to connect to DB
-endpoint = environ.get('ENDPOINT')
-port     = environ.get('PORT')
-dbuser   = environ.get('DBUSER')
-password = environ.get('DBPASSWORD')
-database = environ.get('DATABASE')
+# compiling the response messages of the property file, per language
+messages = MessageCatalog(join(dirname(__file__), 'deletepicture.properties'),
+                          status_codes={'UNAUTHORIZED': 403, 'INVALID_USER': 404})
 
-# secret keys for data encryption and security token
+# secret key for data encryption
 key = environ.get('DB_ENCRYPTION_KEY')
-SECRET_KEY = environ.get('TOKEN_SECRET_KEY')
 
-# Variables related to s3 bucket
-AWS_REGION = environ.get('REGION')
-AWS_ACCESS_KEY = environ.get('ACCESS_KEY_ID')
-AWS_SECRET = environ.get('SECRET_ACCESS_KEY')
-ENVIRONMENT_TYPE = environ.get('ENVIRONMENT_TYPE')
-BUCKET_NAME = environ.get('BUCKET_NAME')
-S3_BUCKET_URL = environ.get('S3_BUCKET_URL')
+# Query for deleting picture_url of user or setting picture_url to NULL
+CLEAR_PICTURE_QUERY = "UPDATE `users` SET `picture_url` = NULL, `is_picture_uploaded`=0 WHERE `id`=%s"
 
 #Logger key
 logging_Level = int(environ.get('LOGGING_LEVEL'))
-# getting message variable
-message_by_language = "165_MESSAGES"
 
 # Getting the logger to log the messages for debugging purposes
 logger   = logging.getLogger()
 # Setting the log level to INFO
 logger.setLevel(logging_Level)
+# Writing the records as sampled, redacted JSON lines
+structured_log.install(logger)
 
 logger.info("Cold start complete.") 
 
-def make_connection():
-    """Function to make the database connection."""
-    return pymysql.connect(host=endpoint, user=dbuser, passwd=password,
-        port=int(port), db=database, autocommit=True)
-
-def log_err(errmsg, status_code):
+def log_err(message_key, language_id=None):
     """Function to log the error messages."""
-    logger.info(errmsg)
-    return  {
-                "statusCode": status_code,
-                "body": json.dumps({"message":errmsg}) , 
-                "headers":{
-                            'Access-Control-Allow-Origin': '*',
-                            'Access-Control-Allow-Credentials': 'true'}, 
-                "isBase64Encoded":"false"
-            }
-
-def jwt_verify(auth_token):
-    """Function to verify the authorization token"""
-    # decoding the authorization token provided by user
-    payload = jwt.decode(auth_token, SECRET_KEY, options={'require_exp': True})
-    
-    # setting the required values in return
-    rid = int(payload['id'])
-    user_id = payload['user_id']
-    language_id = payload['language_id']
-    return rid, user_id, language_id
-
-def delete_image_s3(user_id):
-    """Function to delete image to S3"""
-    # creating boto3 client 
-    S3 = boto3.resource(
-        's3',
-        aws_access_key_id=AWS_ACCESS_KEY,
-        aws_secret_access_key=AWS_SECRET,
-        config=Config(signature_version='s3v4')
-        )
-    response = S3.Object(BUCKET_NAME,user_id + ".png").delete()
-    logger.info(response)
-    
-    # returning response of the delete image
-    return response
+    logger.info(message_key)
+    return messages.error(message_key, language_id)
 
+@metrics.instrumented("deletepicture")
 def handler(event,context):
     """Function to handle the request for delete picture API"""
-    global message_by_language
+    # answering the pings of the lambda warmer
+    if warmup.is_warmup(event):
+        return warmup.handle(event, context)
+    # language of the messages, the default one until the token is verified
+    language_id = None
     try:
         # Fetching data from event and rendering it
         auth_token = event['headers']['Authorization']
     except:
-        logger.error(traceback.format_exc())
-        return log_err (config[message_by_language]['EVENT_DATA_STATUS'], 500)
+        logger.exception('EVENT_DATA_STATUS')
+        return log_err('EVENT_DATA_STATUS', language_id)
         
     try:
         # verifying that the user is authorized or not to see this api's data
-        rid, user_id, language_id = jwt_verify(auth_token)
+        with metrics.phase("jwt_verify"):
+            rid, user_id, language_id = jwt_verify(auth_token)
     except:
         # if user does not have valid authorization
-        logger.error(traceback.format_exc())
-        return log_err(config[message_by_language]['UNAUTHORIZED'], 403)
+        logger.exception('UNAUTHORIZED')
+        return log_err('UNAUTHORIZED', language_id)
         
     try:
-        # Making the DB connection
-        cnx    = make_connection()
-        # Getting the cursor from the DB connection to execute the queries
-        cursor = cnx.cursor()
+        # Getting a cursor on the warm (or freshly opened) DB connection
+        with metrics.phase("connect"):
+            cursor = db_connection.open_cursor()
     except:
-        logger.error(traceback.format_exc())
-        return log_err (config[message_by_language]['CONNECTION_STATUS'], 500)
+        logger.exception('CONNECTION_STATUS')
+        return log_err('CONNECTION_STATUS', language_id)
         
     try:
         try:
-            # Query for getting current language of the user
-            selectionQuery = "SELECT `language_id` FROM `users` WHERE `id`=%s"
-            # Executing the Query
-            cursor.execute(selectionQuery, (rid))
-            
-            result_list = []
-            # fetching result from the cursor
-            for result in cursor: result_list.append(result)
-            
-            # getting current language_id of the user 
-            language_id = result_list[0][0]
-            message_by_language = str(language_id) + "_MESSAGES"
+            # checking the user exist and getting its current language_id, on the connection of the update
+            with metrics.phase("user_lookup"):
+                user_language_id = get_user_language(auth_token, cursor)
+            if user_language_id is None:
+                return log_err('INVALID_USER', language_id)
+            language_id = user_language_id
         except:
             # If there is any error in above operations, logging the error
-            return log_err (config[message_by_language]['INTERNAL_ERROR'], 500)
+            logger.exception('INTERNAL_ERROR')
+            return log_err('INTERNAL_ERROR', language_id)
             
         try:
-            # Query for deleting picture_url of user or setting picture_url to NULL
-            updationQuery = "UPDATE `users` SET `picture_url` = NULL, `is_picture_uploaded`=0 WHERE `id`=%s"
-            # Executing the Query
-            cursor.execute(updationQuery, (rid))
-            delete_image_s3(user_id)
+            with metrics.phase("update"):
+                # updating the user and queuing the S3 deletion together, the S3 object is deleted later
+                cursor.connection.begin()
+                # Executing the Query
+                cursor.execute(CLEAR_PICTURE_QUERY, (rid))
+                picture_deletions.enqueue(cursor, user_id)
+                cursor.connection.commit()
         except:
-            return log_err (config[message_by_language]['IMAGE_STATUS'], 500)
+            logger.exception('IMAGE_STATUS')
+            try:
+                cursor.connection.rollback()
+            except:
+                pass
+            return log_err('IMAGE_STATUS', language_id)
             
         # returning success json
         return {
@@ -160,11 +122,14 @@ def handler(event,context):
                             'Access-Control-Allow-Origin': '*',
                             'Access-Control-Allow-Credentials': 'true'
                             },
-                    'body': json.dumps({"message":config[message_by_language]['SUCCESS_MESSAGE']})
+                    'body': messages.body('SUCCESS_MESSAGE', language_id)
                 }
     except:
-        logger.error(traceback.format_exc())
-        return log_err (config[message_by_language]['INTERNAL_ERROR'], 500)
+        logger.exception('INTERNAL_ERROR')
+        return log_err('INTERNAL_ERROR', language_id)
+    finally:
+        # closing the cursor, the connection stays open for the next invocation
+        db_connection.release_cursor(cursor)
         
 if __name__== "__main__":
     handler(None,None)
\ No newline at end of file
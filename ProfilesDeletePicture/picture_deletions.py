@@ -0,0 +1,164 @@
+"""Module to delete profile pictures from S3 through an outbox table.
+
+It provides the following functionalities:
+1. get_s3_client(): Making the boto3 s3 client once per container
+2. object_key(): Getting the S3 key of the picture of a user
+3. enqueue(): Recording in the `picture_deletions` outbox that a picture has to be deleted
+4. delete_objects(): Deleting up to 1000 keys with one S3 multi-object delete, returning the keys that failed
+5. drain(): Deleting the due pictures of the outbox in batches, retrying failures with exponential backoff
+6. drain_handler(): Handling the scheduled invocation that drains the outbox
+
+The API only writes the outbox row, in the same transaction as the `users` update,
+and returns. A scheduled Lambda (handler picture_deletions.drain_handler) then
+empties the outbox. Deleting an S3 key that is already gone succeeds, so a row
+drained twice (e.g. by two overlapping drains) is harmless. A row whose user has
+uploaded a new picture (under the same key) since it was queued is dropped
+without touching S3.
+"""
+
+import logging
+from os import environ
+from profiles_common import db_connection, metrics
+
+# Variables related to s3 bucket
+AWS_REGION = environ.get('REGION')
+AWS_ACCESS_KEY = environ.get('ACCESS_KEY_ID')
+AWS_SECRET = environ.get('SECRET_ACCESS_KEY')
+BUCKET_NAME = environ.get('BUCKET_NAME')
+
+# S3 accepts at most 1000 keys per multi-object delete
+BATCH_SIZE = min(int(environ.get('PICTURE_DELETION_BATCH_SIZE', '1000')), 1000)
+# batches deleted per drain invocation
+MAX_BATCHES = int(environ.get('PICTURE_DELETION_MAX_BATCHES', '10'))
+# failed rows are retried after BACKOFF_BASE * 2^attempts seconds, capped at BACKOFF_MAX, at most MAX_ATTEMPTS times
+BACKOFF_BASE = int(environ.get('PICTURE_DELETION_BACKOFF_BASE', '30'))
+BACKOFF_MAX  = int(environ.get('PICTURE_DELETION_BACKOFF_MAX', '3600'))
+MAX_ATTEMPTS = int(environ.get('PICTURE_DELETION_MAX_ATTEMPTS', '10'))
+
+# statements on the outbox, served by the indexes of schema/migrations (see schema/check_query_plans.py)
+ENQUEUE_QUERY = ("INSERT INTO `picture_deletions` (`object_key`, `user_id`) VALUES (%s, %s)"
+                 " ON DUPLICATE KEY UPDATE `attempts`=0, `next_attempt_at`=CURRENT_TIMESTAMP, `last_error`=NULL")
+# due rows that still have attempts left, in due order (the order of idx_picture_deletions_due),
+# with the current upload status of their user
+DUE_QUERY = ("SELECT d.`id`, d.`object_key`, u.`is_picture_uploaded` FROM `picture_deletions` d"
+             " LEFT JOIN `users` u ON u.`user_id`=d.`user_id`"
+             " WHERE d.`next_attempt_at`<=CURRENT_TIMESTAMP AND d.`attempts`<%s ORDER BY d.`next_attempt_at` LIMIT %s")
+DELETE_QUERY = "DELETE FROM `picture_deletions` WHERE `id` IN ({placeholders})"
+# MySQL assigns left to right, `next_attempt_at` is set first so that it sees `attempts` before the increment
+RETRY_QUERY = ("UPDATE `picture_deletions` SET"
+               " `next_attempt_at`=CURRENT_TIMESTAMP + INTERVAL LEAST(%s * POW(2, `attempts`), %s) SECOND,"
+               " `attempts`=`attempts`+1, `last_error`=%s"
+               " WHERE `id` IN ({placeholders})")
+
+logger = logging.getLogger()
+
+# boto3 s3 client, created by the first call that needs it
+s3_client = None
+
+
+def get_s3_client():
+    """Function to get the boto3 s3 client of this container."""
+    global s3_client
+    if s3_client is None:
+        # boto3 is only imported by the code paths talking to S3
+        import boto3
+        from botocore.client import Config
+        # creating boto3 client
+        s3_client = boto3.client(
+            's3',
+            region_name=AWS_REGION,
+            aws_access_key_id=AWS_ACCESS_KEY,
+            aws_secret_access_key=AWS_SECRET,
+            config=Config(signature_version='s3v4')
+            )
+    return s3_client
+
+
+def object_key(user_id):
+    """Function to get the S3 key of the picture of a user."""
+    return user_id + ".png"
+
+
+def enqueue(cursor, user_id):
+    """Function to record that the picture of the user has to be deleted."""
+    # a key already waiting is made due again instead of being queued twice
+    cursor.execute(ENQUEUE_QUERY, (object_key(user_id), user_id))
+
+
+def delete_objects(keys, bucket=None):
+    """Function to delete the keys with one multi-object delete, returning {key: error} of the failed ones."""
+    client = get_s3_client()
+    with metrics.phase("s3_delete"):
+        response = client.delete_objects(
+            Bucket=bucket or BUCKET_NAME,
+            # quiet mode only reports the keys that could not be deleted
+            Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True})
+    metrics.add("s3_keys", len(keys))
+    return {error["Key"]: error.get("Code", "Error") for error in response.get("Errors", [])}
+
+
+def _delete_rows(cursor, ids):
+    """Function to remove the given rows from the outbox."""
+    placeholders = ",".join(["%s"] * len(ids))
+    cursor.execute(DELETE_QUERY.format(placeholders=placeholders), tuple(ids))
+
+
+def _retry_later(cursor, ids, error):
+    """Function to push the given outbox rows back with an exponential backoff."""
+    placeholders = ",".join(["%s"] * len(ids))
+    cursor.execute(RETRY_QUERY.format(placeholders=placeholders), (BACKOFF_BASE, BACKOFF_MAX, error[:255]) + tuple(ids))
+
+
+def drain(cursor, batch_size=BATCH_SIZE, max_batches=MAX_BATCHES):
+    """Function to delete the due pictures of the outbox, returning the number deleted and failed."""
+    deleted = failed = 0
+    for _ in range(max_batches):
+        # due rows that still have attempts left, with the current upload status of their user
+        cursor.execute(DUE_QUERY, (MAX_ATTEMPTS, batch_size))
+        batch = cursor.fetchall()
+        if not batch:
+            break
+
+        # pictures uploaded again since they were queued must be kept
+        reuploaded = [row[0] for row in batch if row[2] == 1]
+        if reuploaded:
+            _delete_rows(cursor, reuploaded)
+        rows = [row for row in batch if row[2] != 1]
+        if not rows:
+            continue
+
+        try:
+            errors = delete_objects([row[1] for row in rows])
+        except Exception as e:
+            # the whole request failed, every row of the batch is retried later
+            logger.exception("S3 multi-object delete failed")
+            errors = {row[1]: type(e).__name__ for row in rows}
+
+        done = [row[0] for row in rows if row[1] not in errors]
+        if done:
+            _delete_rows(cursor, done)
+        # grouping the failed rows by error to push them back with one statement per error
+        retries = {}
+        for row in rows:
+            if row[1] in errors:
+                retries.setdefault(errors[row[1]], []).append(row[0])
+        for error, ids in retries.items():
+            _retry_later(cursor, ids, error)
+
+        deleted += len(done)
+        failed += len(rows) - len(done)
+        if len(batch) < batch_size:
+            break
+    return deleted, failed
+
+
+@metrics.instrumented("picture_deletions_drain")
+def drain_handler(event, context):
+    """Function to handle the scheduled invocation draining the outbox."""
+    cursor = db_connection.open_cursor()
+    try:
+        deleted, failed = drain(cursor)
+    finally:
+        db_connection.release_cursor(cursor)
+    logger.info("Picture deletions drained: %d deleted, %d failed", deleted, failed)
+    return {"deleted": deleted, "failed": failed}
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+"""Module to purge the profile pictures of many users at once (account deletion sweeps, GDPR batches).
+
+It provides the following functionalities:
+1. read_user_ids(): Streaming the user ids of a file (or stdin), one per line
+2. load_checkpoint() / save_checkpoint(): Reading and atomically replacing the checkpoint of a run
+3. clear_chunk(): Clearing the pictures of a chunk of users and queuing their S3 keys in the
+   `picture_deletions` outbox, in one transaction of set-based statements
+4. purge(): Clearing the users chunk by chunk while their keys are deleted with S3 multi-object
+   deletes (picture_deletions.delete_objects) on a bounded thread pool, reporting the throughput
+5. purge_handler(): Handling an invocation carrying {"user_ids": [...]}
+6. main(): Command line entry point
+
+A chunk is committed (users cleared, keys queued) before its keys are deleted from S3, and
+the outbox rows of the keys deleted are removed afterwards. Keys whose deletion fails stay
+in the outbox and are retried by picture_deletions.drain_handler, so a purge that stops
+half way never leaves a cleared user with its picture in S3. Ids without a users row are
+skipped, so `deleted` and `failed` count the keys of the `users_found`, of which
+`users_updated` still had a picture. The checkpoint records how
+many user ids of the stream are done; a run given the same stream and checkpoint skips
+them. Work done after the last checkpoint is done again, which is harmless.
+
+Usage: python picture_purge.py --input user_ids.txt [--checkpoint purge.json] [--chunk-size 1000] [--workers 8]
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+from os import environ
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from profiles_common import db_connection, metrics
+import picture_deletions
+
+# users cleared per transaction, at most 1000 since each chunk is one S3 multi-object delete
+CHUNK_SIZE = min(int(environ.get('PICTURE_PURGE_CHUNK_SIZE', '1000')), 1000)
+# S3 deletes running at once, and chunks committed but not yet deleted from S3
+WORKERS = int(environ.get('PICTURE_PURGE_WORKERS', '8'))
+MAX_PENDING = int(environ.get('PICTURE_PURGE_MAX_PENDING', str(2 * WORKERS)))
+# seconds between two throughput reports
+REPORT_INTERVAL = float(environ.get('PICTURE_PURGE_REPORT_INTERVAL', '10'))
+
+# users of a chunk that exist, only their keys are queued and deleted, served by idx_users_user_id
+EXISTING_USERS_QUERY = "SELECT `user_id` FROM `users` WHERE `user_id` IN ({placeholders})"
+# set-based version of the update of ProfilesDeletePicture, served by idx_users_user_id
+CLEAR_PICTURES_QUERY = ("UPDATE `users` SET `picture_url` = NULL, `is_picture_uploaded`=0"
+                        " WHERE `user_id` IN ({placeholders})")
+# picture_deletions.ENQUEUE_QUERY for many keys at once
+ENQUEUE_MANY_QUERY = ("INSERT INTO `picture_deletions` (`object_key`, `user_id`) VALUES {values}"
+                      " ON DUPLICATE KEY UPDATE `attempts`=0, `next_attempt_at`=CURRENT_TIMESTAMP, `last_error`=NULL")
+# outbox rows of the keys deleted from S3, served by uq_picture_deletions_object_key
+DEQUEUE_QUERY = "DELETE FROM `picture_deletions` WHERE `object_key` IN ({placeholders})"
+
+logger = logging.getLogger()
+
+
+def read_user_ids(stream):
+    """Function to get the user ids of the lines of a stream, blank lines and # comments skipped."""
+    for line in stream:
+        user_id = line.strip()
+        if user_id and not user_id.startswith('#'):
+            yield user_id
+
+
+def load_checkpoint(path):
+    """Function to get the checkpoint of a run, an empty one if there is none yet."""
+    checkpoint = {"processed": 0, "users_found": 0, "users_updated": 0, "deleted": 0, "failed": 0}
+    if path and os.path.exists(path):
+        with open(path) as checkpoint_file:
+            checkpoint.update(json.load(checkpoint_file))
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    """Function to replace the checkpoint of a run, atomically so that a crash never leaves half a file."""
+    if not path:
+        return
+    temporary = path + ".tmp"
+    with open(temporary, 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(temporary, path)
+
+
+def clear_chunk(cursor, user_ids):
+    """Function to clear the pictures of the existing users of the chunk and queue their keys,
+    returning the keys and the number of users updated."""
+    cursor.connection.begin()
+    try:
+        cursor.execute(EXISTING_USERS_QUERY.format(placeholders=",".join(["%s"] * len(user_ids))), tuple(user_ids))
+        # ids of the stream without a users row have no picture to delete
+        found = [row[0] for row in cursor.fetchall()]
+        keys = [picture_deletions.object_key(user_id) for user_id in found]
+        updated = 0
+        if found:
+            placeholders = ",".join(["%s"] * len(found))
+            updated = cursor.execute(CLEAR_PICTURES_QUERY.format(placeholders=placeholders), tuple(found))
+            values = ",".join(["(%s, %s)"] * len(found))
+            cursor.execute(ENQUEUE_MANY_QUERY.format(values=values),
+                           tuple(item for pair in zip(keys, found) for item in pair))
+        cursor.connection.commit()
+    except:
+        cursor.connection.rollback()
+        raise
+    return keys, updated
+
+
+def _dequeue(cursor, keys):
+    """Function to remove the outbox rows of the keys deleted from S3."""
+    placeholders = ",".join(["%s"] * len(keys))
+    cursor.execute(DEQUEUE_QUERY.format(placeholders=placeholders), tuple(keys))
+
+
+def _delete_chunk(keys):
+    """Function to delete the keys of a chunk from S3, returning {key: error} of the failed ones."""
+    if not keys:
+        # none of the users of the chunk exist
+        return {}
+    try:
+        return picture_deletions.delete_objects(keys)
+    except Exception as e:
+        # the whole request failed, the drain retries every key of the chunk
+        logger.exception("S3 multi-object delete of %d keys failed", len(keys))
+        return {key: type(e).__name__ for key in keys}
+
+
+def purge(user_ids, cursor, checkpoint_path=None, chunk_size=CHUNK_SIZE, workers=WORKERS, max_pending=MAX_PENDING):
+    """Function to purge the pictures of a stream of user ids, returning the totals and the throughput."""
+    chunk_size = max(1, min(chunk_size, 1000))
+    checkpoint = load_checkpoint(checkpoint_path)
+    user_ids = iter(user_ids)
+    # the ids done by a previous run of the same stream
+    skipped = sum(1 for _ in islice(user_ids, checkpoint["processed"]))
+    if skipped:
+        logger.info("Resuming after %d user ids", skipped)
+
+    # the S3 client is made before the workers share it
+    picture_deletions.get_s3_client()
+    start = last_report = time.monotonic()
+    done = {"users": 0, "keys": 0}
+    # chunk index -> number of user ids in it, for the chunks whose S3 delete has not finished
+    in_flight = {}
+    # S3 delete future -> (chunk index, keys)
+    chunks = {}
+    finished = set()
+    next_index = watermark = 0
+    pending = set()
+
+    def collect(futures):
+        """Function to record the S3 deletes that finished and move the checkpoint forward."""
+        nonlocal watermark
+        for future in futures:
+            index, keys = chunks.pop(future)
+            errors = future.result()
+            deleted = [key for key in keys if key not in errors]
+            if deleted:
+                try:
+                    with metrics.phase("dequeue"):
+                        _dequeue(cursor, deleted)
+                except:
+                    # the keys are gone from S3, their rows stay in the outbox and the drain deletes
+                    # them again harmlessly; a broken cursor must not hide the error that stopped the purge
+                    logger.exception("Removing %d deleted keys from the outbox failed", len(deleted))
+            checkpoint["deleted"] += len(deleted)
+            checkpoint["failed"] += len(errors)
+            done["keys"] += len(keys)
+            finished.add(index)
+        # the checkpoint only covers the chunks before the first one still in flight
+        advanced = False
+        while watermark in finished:
+            finished.discard(watermark)
+            checkpoint["processed"] += in_flight.pop(watermark)
+            watermark += 1
+            advanced = True
+        if advanced:
+            save_checkpoint(checkpoint_path, checkpoint)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        try:
+            while True:
+                chunk = list(islice(user_ids, chunk_size))
+                if not chunk:
+                    break
+                with metrics.phase("users_update"):
+                    keys, updated = clear_chunk(cursor, chunk)
+                checkpoint["users_found"] += len(keys)
+                checkpoint["users_updated"] += updated
+                done["users"] += len(chunk)
+
+                future = pool.submit(_delete_chunk, keys)
+                chunks[future] = (next_index, keys)
+                in_flight[next_index] = len(chunk)
+                next_index += 1
+                pending.add(future)
+                if len(pending) >= max_pending:
+                    # bounding the committed chunks waiting for S3
+                    finished_futures, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(finished_futures)
+
+                now = time.monotonic()
+                if now - last_report >= REPORT_INTERVAL:
+                    last_report = now
+                    elapsed = now - start
+                    logger.info("Purged %d users (%.0f users/s), %d keys through S3 (%.0f keys/s), %d failed",
+                                done["users"], done["users"] / elapsed, done["keys"], done["keys"] / elapsed,
+                                checkpoint["failed"])
+        finally:
+            # the deletes already running are recorded, also when the purge stops on an error
+            finished_futures, pending = wait(pending)
+            collect(finished_futures)
+
+    elapsed = time.monotonic() - start
+    metrics.add("s3_keys_failed", checkpoint["failed"])
+    report = dict(checkpoint, skipped=skipped, seconds=round(elapsed, 3),
+                  users_per_second=round(done["users"] / elapsed, 1) if elapsed else None,
+                  keys_per_second=round(done["keys"] / elapsed, 1) if elapsed else None)
+    logger.info("Picture purge done: %s", report)
+    return report
+
+
+@metrics.instrumented("picture_purge")
+def purge_handler(event, context):
+    """Function to handle an invocation purging the pictures of event["user_ids"]."""
+    cursor = db_connection.open_cursor()
+    try:
+        return purge(event.get('user_ids') or [], cursor)
+    finally:
+        db_connection.release_cursor(cursor)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Purge the profile pictures of a list of users")
+    parser.add_argument('--input', default='-', help="file of user ids, one per line (default: stdin)")
+    parser.add_argument('--checkpoint', help="checkpoint file, the run resumes from it when it exists")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="users per transaction and S3 delete (max 1000)")
+    parser.add_argument('--workers', type=int, default=WORKERS, help="S3 deletes running at once")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    stream = sys.stdin if args.input == '-' else open(args.input)
+    cursor = db_connection.open_cursor()
+    try:
+        report = purge(read_user_ids(stream), cursor, args.checkpoint, args.chunk_size, args.workers)
+    finally:
+        db_connection.release_cursor(cursor)
+        if stream is not sys.stdin:
+            stream.close()
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,35 +3,53 @@
 """API Module to provide Fetching Questions Functionalities.
 
 It provides the following functionalities:
-1. make_connection(): Connecting to the Database using connection details received through environment variables
-2. log_err(): Logging error and returning the JSON response with error message & status code
-3. handler(): Handling the incoming request with following steps:
+1. make_client(): Making the boto3 aws client used to invoke other lambda functions, once per container
+2. log_err(): Returning the prebuilt JSON response with error message & status code
+3. get_header(): Getting a request header whatever the case of its name
+4. load_questions(): Getting the serialized questions of a language (and their version) from the
+   deployed bundles or the database and caching them
+5. questions_response(): Building the success response, 304 when the client has it already,
+   compressed when the client accepts it
+6. prime_caches(): Filling the caches of the container when the lambda warmer pings it
+7. handler(): Handling the incoming request with following steps:
 - Fetching the questions 
 - Returning the JSON response with list of questions and success status code
 
+The DB connection is shared between warm invocations through profiles_common.db_connection,
+and the handler only reads, so it uses a read replica when REPLICA_ENDPOINTS lists usable ones.
+The serialized questions of each language are kept in a module level TTL/LRU cache and the
+active user count is served from the snapshot of user_counter, so a warm container answers
+without touching the database. A missing language_id is resolved from Accept-Language by
+language_resolver, ProfilesGetLanguage is only invoked for headers it does not know.
+The time spent in each phase is recorded through profiles_common.metrics.
+The response messages are compiled once per container by profiles_common.message_catalog
+and the language of a request is only kept in the handler's local variables.
+Logs are written as sampled, redacted JSON lines by profiles_common.structured_log.
+Pings of the lambda warmer are answered by profiles_common.warmup, with prime_caches()
+loading the questions of every known language and the user count ahead of traffic.
+
+The questions of the languages exported by question_bundles (the build step) are served
+from the deployed bundles, the database is only queried for the other ones. Responses
+carry an ETag made of the questions version and the user count, so a matching
+If-None-Match gets a 304, and are gzip / brotli compressed (base64 body) according to
+Accept-Encoding. A compressed body is built once per version, user count and encoding.
+
 """
 
 import json
-import pymysql
+import base64
 import logging
-import traceback
 from os import environ
-import configparser
-import boto3
-
-# For getting messages according to language of the user
-message_by_language = "165_MESSAGES"
+from os.path import dirname, join
+from profiles_common import db_connection, metrics, warmup, structured_log
+from profiles_common.message_catalog import MessageCatalog
+from profiles_common.ttl_cache import TTLCache
+import user_counter
+import language_resolver
+import question_bundles
 
-# reading values from property file to get all the response messages
-config = configparser.ConfigParser()
-config.read('getbig5.properties', encoding = "ISO-8859-1")
-
-# Getting the DB details from the environment variables to connect to DB
-endpoint = environ.get('ENDPOINT')
-port     = environ.get('PORT')
-dbuser   = environ.get('DBUSER')
-password = environ.get('DBPASSWORD')
-database = environ.get('DATABASE')
+# compiling the response messages of the property file, per language
+messages = MessageCatalog(join(dirname(__file__), 'getquestions.properties'))
 
 # aws cridentials required for creating boto3 client object
 AWS_REGION = environ.get('REGION')
@@ -45,154 +63,234 @@ logging_Level = int(environ.get('LOGGING_LEVEL'))
 logger   = logging.getLogger()
 # Setting the log level to INFO
 logger.setLevel(logging_Level)
+# Writing the records as sampled, redacted JSON lines
+structured_log.install(logger)
+
+# Cache of the serialized questions per language_id, kept across warm invocations
+QUESTIONS_CACHE_TTL  = float(environ.get('QUESTIONS_CACHE_TTL', '3600'))
+QUESTIONS_CACHE_SIZE = int(environ.get('QUESTIONS_CACHE_SIZE', '8'))
+question_cache = TTLCache(QUESTIONS_CACHE_SIZE, QUESTIONS_CACHE_TTL)
+
+# Encodings the responses may be compressed with, in order of preference (empty turns compression off,
+# API Gateway must list */* as binary media type to return the compressed bodies)
+QUESTIONS_ENCODINGS = tuple(encoding.strip() for encoding in environ.get('QUESTIONS_ENCODINGS', 'br,gzip').split(',') if encoding.strip())
+# Seconds browsers and CDNs may reuse a response, the user count refreshes at the same pace
+CACHE_CONTROL = "public, max-age=%d" % int(environ.get('QUESTIONS_MAX_AGE', str(int(user_counter.USER_COUNT_TTL))))
+# Compressed bodies, base64 encoded, per (language_id, version, total_user_count, encoding)
+body_cache = TTLCache(int(environ.get('QUESTIONS_BODY_CACHE_SIZE', '32')), user_counter.USER_COUNT_TTL)
+
+# Success body, questions are spliced in already serialized (same output as json.dumps)
+QUESTIONS_BODY = '{"questions": %s, "total_user_count": %d, "language_id": %d}'
+
+# boto3 lambda client, created by the first request that needs it
+lambda_client = None
 
 logger.info("Cold start complete.") 
 
-def make_connection():
-    """Function to make the database connection."""
-    return pymysql.connect(host=endpoint, user=dbuser, passwd=password,
-        port=int(port), db=database, autocommit=True)
-        
 def make_client():
     """Making a boto3 aws client to perform invoking of functions"""
+    global lambda_client
+    # reusing the client of this container if it was already created
+    if lambda_client is not None:
+        return lambda_client
     
+    # boto3 is only imported when ProfilesGetLanguage has to be invoked
+    import boto3
     # creating an aws client object by providing different cridentials
-    invokeLam = boto3.client(
+    lambda_client = boto3.client(
                                 "lambda", 
                                 region_name=AWS_REGION,
                                 aws_access_key_id=AWS_ACCESS_KEY,
                                 aws_secret_access_key=AWS_SECRET
                             )
     # returning the object
-    return invokeLam
+    return lambda_client
 
-def log_err(errmsg):
+def log_err(message_key, language_id=None):
     """Function to log the error messages."""
-    return  {
-                "statusCode": 500,
-                "body": json.dumps({"message":errmsg}) , 
-                "headers":{
-                            'Access-Control-Allow-Origin': '*',
-                            'Access-Control-Allow-Credentials': 'true'}, 
-                "isBase64Encoded":"false"
-            }
+    return messages.error(message_key, language_id)
+
+def get_header(event, name):
+    """Function to get a header of the request, None when it is missing."""
+    headers = event.get('headers') or {}
+    if name in headers:
+        return headers[name]
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+def load_questions(cursor, language_id):
+    """Function to get the (questions JSON array, version) of a language, None if there are none.
+
+    The deployed bundle of the language is used when there is one, cursor may then be None.
+    """
+    questions = question_bundles.get_bundle(language_id)
+    if questions is None and cursor is not None:
+        questions_json = question_bundles.fetch_questions_json(cursor, language_id)
+        if questions_json is not None:
+            questions = (questions_json, question_bundles.version_of(questions_json))
+    if questions is None:
+        # Not caching missing languages so that newly added translations show up
+        return None
+
+    question_cache.set(language_id, questions)
+    return questions
+
+def questions_response(event, language_id, questions, total_user_count):
+    """Function to build the success response of the questions."""
+    questions_json, version = questions
+    encoding = question_bundles.negotiate_encoding(get_header(event, 'Accept-Encoding'), QUESTIONS_ENCODINGS)
+    # strong validators differ per content-coding, the tag of the identity body has no suffix
+    identity_etag = '"%s-%d"' % (version, total_user_count)
+    etag = identity_etag if encoding is None else '"%s-%d-%s"' % (version, total_user_count, encoding)
+    headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Credentials': 'true',
+        'Content-Type': 'application/json',
+        'ETag': etag,
+        'Cache-Control': CACHE_CONTROL,
+        # the language is picked from these headers and the body from Accept-Encoding
+        'Vary': 'Accept-Encoding, Accept-Language, language_id'
+    }
+
+    if_none_match = get_header(event, 'If-None-Match')
+    if if_none_match:
+        # weak comparison, a tag of this representation or of the identity one matches
+        tags = {tag.strip()[2:] if tag.strip()[:2] == 'W/' else tag.strip() for tag in if_none_match.split(',')}
+        if tags & {etag, identity_etag, '*'}:
+            # the client already has this version of the response
+            return {'statusCode': 304, 'headers': headers, 'body': ''}
+
+    if encoding is None:
+        body = QUESTIONS_BODY % (questions_json, total_user_count, language_id)
+        metrics.add("payload_bytes", len(body))
+        return {'statusCode': 200, 'headers': headers, 'body': body}
+
+    key = (language_id, version, total_user_count, encoding)
+    body = body_cache.get(key)
+    if body is None:
+        with metrics.phase("compress"):
+            raw = (QUESTIONS_BODY % (questions_json, total_user_count, language_id)).encode('utf-8')
+            body = base64.b64encode(question_bundles.compress(raw, encoding)).decode('ascii')
+        body_cache.set(key, body)
+    metrics.add("payload_bytes", len(body))
+    headers['Content-Encoding'] = encoding
+    return {'statusCode': 200, 'headers': headers, 'body': body, 'isBase64Encoded': True}
 
+def prime_caches(cursor):
+    """Function to fill the caches with the questions of every known language and the user count."""
+    # every language the API can answer in, from the language table and the messages
+    language_ids = set(language_resolver.load_language_table().values()) | set(messages.languages())
+    if user_counter.get_cached_count() is None:
+        user_counter.refresh_count(cursor)
+    for language_id in sorted(language_ids):
+        if question_cache.get(language_id) is None:
+            load_questions(cursor, language_id)
+
+@metrics.instrumented("getquestions")
 def handler(event,context):
     """Function to handle the request for Get Big5 API."""
-    global message_by_language
-    try:
-        logger.info(event)
-        # checking that the following event call is from lambda warmer or not
-        if event['source']=="lambda_warmer":
-            logger.info("lambda warmed")
-            # returning the success json
-            return {
-                       'status_code':200,
-                       'body':{"message":"lambda warmed"}
-                   }
-    except:
-        # If there is any error in above operations
-        pass
+    # the event is only redacted and formatted when DEBUG records are written
+    logger.debug("Event %s", event)
+    # answering the pings of the lambda warmer
+    if warmup.is_warmup(event):
+        return warmup.handle(event, context, prime=prime_caches)
     
     try:
         # fetching language_id from the event data
         language_id = event['headers']['language_id']
         if language_id == "null":
             try:
-                # making an boto 3 client object
-                invokeLam = make_client()
-                # invoking the lambda function with custom payload
-                response = invokeLam.invoke(FunctionName= "ProfilesGetLanguage" + ENVIRONMENT_TYPE, InvocationType="RequestResponse", Payload=json.dumps({"headers":{"Accept-Language":event['headers']['Accept-Language']}}))
-                response = response['Payload']
-                response = json.loads(response.read().decode("utf-8"))
-                # gettin language_id from response
-                language_id = json.loads(response['body'])['language_id']
+                accept_language = event['headers']['Accept-Language']
+                with metrics.phase("language"):
+                    # resolving the language locally from the language table
+                    language_id = language_resolver.resolve_language_id(accept_language)
+                    if language_id is None:
+                        # getting the boto 3 client object of this container
+                        invokeLam = make_client()
+                        # invoking the lambda function with custom payload
+                        response = invokeLam.invoke(FunctionName= "ProfilesGetLanguage" + ENVIRONMENT_TYPE, InvocationType="RequestResponse", Payload=json.dumps({"headers":{"Accept-Language":accept_language}}))
+                        response = response['Payload']
+                        response = json.loads(response.read().decode("utf-8"))
+                        # gettin language_id from response
+                        language_id = json.loads(response['body'])['language_id']
+                        language_resolver.remember_language_id(accept_language, language_id)
             except:
                 # If there is any error in above operations, logging the error
-                logger.error(traceback.format_exc())
-                return log_err(config[message_by_language]['INVOCATION_ERROR'])
+                logger.exception('INVOCATION_ERROR')
+                return log_err('INVOCATION_ERROR')
                 
-        messsage_by_language = str(language_id) + "_MESSAGES"
+        # the messages of the request are in its language from here on
+        language_id = int(language_id)
     except:
         # If there is any error in above operations, logging the error
-        logger.error(traceback.format_exc())
-        return log_err(config[message_by_language]['EVENT_DATA_STATUS'])
+        logger.exception('EVENT_DATA_STATUS')
+        return log_err('EVENT_DATA_STATUS')
         
+    # Values served from the container caches, the DB is only queried for the missing ones
+    total_user_count = user_counter.get_cached_count()
+    questions = question_cache.get(language_id)
+    # hit / miss of every request as metrics counts for sizing the cache TTL, the log line is DEBUG only
+    metrics.add("question_cache_hit", int(questions is not None))
+    metrics.add("question_cache_miss", int(questions is None))
+    metrics.add("question_cache_size", question_cache.stats()["size"])
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Question cache %s for language %s %s", "hit" if questions is not None else "miss", language_id, question_cache.stats())
+    if questions is None:
+        # the deployed bundle of the language, no database needed for it
+        questions = load_questions(None, language_id)
+
+    cursor = None
     try:
-        # Making the DB connection
-        cnx    = make_connection()
-        # Getting the cursor from the DB connection to execute the queries
-        cursor = cnx.cursor()
-        
-        try:
-            # Constructing the query to get language_id according to country code
-            selectionQuery = "SELECT COUNT(*) FROM `users` WHERE `is_active`=1"
-            cursor.execute(selectionQuery)
+        if total_user_count is None or questions is None:
             try:
-                ans_list = []
-                for result in cursor: ans_list.append(result)
-                total_user_count = ans_list[0][0]
+                # Getting a cursor on the warm (or freshly opened) DB connection, a replica
+                # one when there is a usable replica since the handler only reads
+                with metrics.phase("connect"):
+                    cursor = db_connection.open_read_cursor()
             except:
                 # If there is any error in above operations, logging the error
-                logger.error(traceback.format_exc())
-                return log_err (config['MESSAGES']['TOTAL_USER_COUNT'])
-        except:
-            # If there is any error in above operations, logging the error
-            logger.error(traceback.format_exc())
-            return log_err (config['MESSAGES']['QUERY_EXECUTION_STATUS'])
-            
-        try:
-            # Getting questions according to the language id
-            if int(language_id)==165:
-                # Constructing query to fetch questions
-                query    = "SELECT `id`,`question` FROM `questions_120` WHERE `language_id`=%s"
-                # Executing the query using cursor
-                cursor.execute(query, (language_id))
-            else:
-                # Constructing query to fetch questions
-                query    = "SELECT `question_id`,`question` FROM `questions_120_translations` WHERE `language_id`=%s"
-                # Executing the query using cursor
-                cursor.execute(query, (language_id))
-        except:
-            # If there is any error in above operations, logging the error
-            logger.error(traceback.format_exc())
-            return log_err (config[message_by_language]['QUERY_EXECUTION_STATUS'])
+                logger.exception('CONNECTION_STATUS')
+                return log_err('CONNECTION_STATUS', language_id)
+
+        if total_user_count is None:
+            try:
+                # Refreshing the snapshot of the active user count
+                with metrics.phase("user_count"):
+                    total_user_count = user_counter.refresh_count(cursor)
+            except:
+                # If there is any error in above operations, logging the error
+                logger.exception('TOTAL_USER_COUNT')
+                return log_err('TOTAL_USER_COUNT', language_id)
+
+        if questions is None:
+            try:
+                # Getting the serialized questions of the language
+                with metrics.phase("questions"):
+                    questions = load_questions(cursor, language_id)
+            except:
+                # If there is any error in above operations, logging the error
+                logger.exception('QUERY_EXECUTION_STATUS')
+                return log_err('QUERY_EXECUTION_STATUS', language_id)
         
-        try:
-            results_list=[]
-            # Iterating through all results and preparing a list
-            for result in cursor: results_list.append({"id":result[0],"question":result[1]})
-            results_list[0]
-            # Returning JSON response           
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Credentials': 'true'
-                },
-                'body': json.dumps({"questions":results_list, "total_user_count":total_user_count, "language_id":int(language_id)})
-            }
-        except:
-            # If there is any error in above operations, logging the error
+        if questions is None:
+            # No questions found for the language
             return {
                     'statusCode': 200,
                     'headers': {
                         'Access-Control-Allow-Origin': '*',
                         'Access-Control-Allow-Credentials': 'true'
                     },
-                    'body': json.dumps({"message":config[message_by_language]['QUESTIONS_STATUS']})
+                    'body': messages.body('QUESTIONS_STATUS', language_id)
                 }
-    except:
-        # If there is any error in above operations, logging the error
-        logger.error(traceback.format_exc())
-        return log_err(config[message_by_language]['CONNECTION_STATUS'])
+        # Returning JSON response (or 304), compressed when the client accepts it
+        return questions_response(event, language_id, questions, total_user_count)
     finally:
-        try:
-            # Finally, clean up the connection
-            cursor.close()
-            cnx.close()
-        except: 
-            pass
+        if cursor is not None:
+            # Finally, close the cursor, the connection stays open for the next invocation
+            db_connection.release_cursor(cursor)
 
 if __name__== "__main__":
     handler(None,None)
\ No newline at end of file
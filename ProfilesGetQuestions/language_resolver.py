@@ -0,0 +1,83 @@
+"""Module to resolve the language_id of a request from its Accept-Language header.
+
+It provides the following functionalities:
+1. load_language_table(): Reading the tag to language_id table of languages.properties once per container
+2. parse_accept_language(): Getting the language tags of an Accept-Language header ordered by their q-value
+3. resolve_language_id(): Getting the language_id of a header, None when its most preferred tag is not known
+4. remember_language_id(): Caching the language_id resolved for a header by ProfilesGetLanguage
+
+Headers that are not resolved locally are still sent to ProfilesGetLanguage by the
+handler, and its answer is cached per header so that it is only asked once.
+"""
+
+import configparser
+from os import environ
+from os.path import dirname, join
+from profiles_common.ttl_cache import TTLCache
+
+LANGUAGE_TABLE_FILE = join(dirname(__file__), 'languages.properties')
+
+# language_id resolved per Accept-Language header value
+header_cache = TTLCache(int(environ.get('LANGUAGE_CACHE_SIZE', '256')),
+                        float(environ.get('LANGUAGE_CACHE_TTL', '86400')))
+
+# tag -> language_id, loaded on first use
+_language_table = None
+
+
+def load_language_table():
+    """Function to get the tag to language_id table, reading it on first use."""
+    global _language_table
+    if _language_table is None:
+        config = configparser.ConfigParser()
+        config.read(LANGUAGE_TABLE_FILE, encoding = "ISO-8859-1")
+        _language_table = {tag.lower(): int(language_id) for tag, language_id in config['LANGUAGES'].items()}
+    return _language_table
+
+
+def parse_accept_language(header):
+    """Function to get the tags of the header from the most to the least preferred."""
+    weighted = []
+    for position, item in enumerate(header.split(',')):
+        parts = item.strip().split(';')
+        tag = parts[0].strip().lower()
+        if not tag:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        # q=0 means "not acceptable"
+        if q > 0:
+            weighted.append((-q, position, tag))
+    weighted.sort()
+    return [tag for _, _, tag in weighted]
+
+
+def resolve_language_id(header):
+    """Function to get the language_id of the header, None if it has to be resolved remotely."""
+    language_id = header_cache.get(header)
+    if language_id is not None:
+        return language_id
+
+    tags = parse_accept_language(header)
+    if not tags:
+        return None
+    # only the most preferred tag is answered locally, a less preferred known tag must not
+    # win over a language that ProfilesGetLanguage may know
+    tag = tags[0]
+    table = load_language_table()
+    # trying the full tag (e.g. es-mx) before its primary subtag (es)
+    language_id = table.get(tag, table.get(tag.split('-')[0]))
+    if language_id is not None:
+        header_cache.set(header, language_id)
+    return language_id
+
+
+def remember_language_id(header, language_id):
+    """Function to cache the language_id resolved remotely for the header."""
+    header_cache.set(header, int(language_id))
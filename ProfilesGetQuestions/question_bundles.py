@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+"""Module to build, load and compress the versioned question bundles of ProfilesGetQuestions.
+
+It provides the following functionalities:
+1. fetch_questions_json(): Querying the questions of a language as a JSON array
+2. version_of(): Getting the content hash (version) of a questions JSON array
+3. export_bundles(): Build step writing the questions of each language as a content-hashed
+   JSON file (plus gzip and brotli copies with --precompressed) and the manifest.json listing them
+4. get_bundle(): Getting the questions JSON and version of a language from the deployed bundles
+5. negotiate_encoding(): Picking br / gzip / identity for an Accept-Encoding header
+6. compress(): Compressing a response body with the negotiated encoding, with fast settings on the
+   request path and the densest ones for the precompressed bundles
+
+Run the build step before packaging the function, whenever questions_120 or
+questions_120_translations change:
+
+    python question_bundles.py [--output bundles] [--languages 165 245] [--precompressed]
+
+It uses the database of the ENDPOINT / PORT / DBUSER / DBPASSWORD / DATABASE variables.
+The bundles/ directory is then deployed with the function, and the handler serves
+the questions of the languages it holds without querying the database. The file
+names carry the content hash, so the files can also be uploaded as immutable
+objects to S3 / a CDN. The handler compresses its bodies itself since they also
+carry the user count, so the .gz / .br copies are only written with --precompressed,
+into a directory meant for that upload rather than the deployed bundles/. brotli is
+optional: without it no .br files are written and br is never negotiated.
+"""
+
+import os
+import sys
+import gzip
+import json
+import hashlib
+import logging
+from os import environ
+from os.path import dirname, join
+
+BUNDLE_DIR = join(dirname(os.path.abspath(__file__)), 'bundles')
+MANIFEST_FILE = 'manifest.json'
+
+# compression of the bundles, done once at build time so the densest settings are affordable
+GZIP_LEVEL = int(environ.get('QUESTIONS_GZIP_LEVEL', '9'))
+BROTLI_QUALITY = int(environ.get('QUESTIONS_BROTLI_QUALITY', '11'))
+# compression of the response bodies on the request path, fast settings close in size to the dense ones
+RESPONSE_GZIP_LEVEL = int(environ.get('QUESTIONS_RESPONSE_GZIP_LEVEL', '6'))
+RESPONSE_BROTLI_QUALITY = int(environ.get('QUESTIONS_RESPONSE_BROTLI_QUALITY', '5'))
+
+# Queries of the questions of a language, 165 (English) has its own table
+QUESTIONS_QUERY = "SELECT `id`,`question` FROM `questions_120` WHERE `language_id`=%s"
+TRANSLATED_QUESTIONS_QUERY = "SELECT `question_id`,`question` FROM `questions_120_translations` WHERE `language_id`=%s"
+
+logger = logging.getLogger()
+
+# language_id -> (questions JSON, version) of the deployed bundles, filled on first use
+_bundles = None
+# brotli module, False when it is not installed, None until first checked
+_brotli = None
+
+
+def fetch_questions_json(cursor, language_id):
+    """Function to query the questions of a language as a JSON array, None if there are none."""
+    # Getting questions according to the language id
+    query = QUESTIONS_QUERY if language_id == 165 else TRANSLATED_QUESTIONS_QUERY
+    # Executing the query using cursor
+    cursor.execute(query, (language_id))
+
+    results_list = []
+    # Iterating through all results and preparing a list
+    for result in cursor: results_list.append({"id": result[0], "question": result[1]})
+    if not results_list:
+        return None
+    return json.dumps(results_list)
+
+
+def version_of(questions_json):
+    """Function to get the version of a questions JSON array, a hash of its content."""
+    return hashlib.sha256(questions_json.encode('utf-8')).hexdigest()[:16]
+
+
+def get_brotli():
+    """Function to get the brotli module, None when it is not installed."""
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+            _brotli = brotli
+        except ImportError:
+            _brotli = False
+    return _brotli or None
+
+
+def compress(data, encoding, build=False):
+    """Function to compress bytes with "gzip" or "br", with the build settings when build is set."""
+    if encoding == "gzip":
+        # mtime 0 keeps the output identical for identical input
+        return gzip.compress(data, GZIP_LEVEL if build else RESPONSE_GZIP_LEVEL, mtime=0)
+    if encoding == "br":
+        return get_brotli().compress(data, quality=BROTLI_QUALITY if build else RESPONSE_BROTLI_QUALITY)
+    raise ValueError("Unsupported encoding %r" % encoding)
+
+
+def negotiate_encoding(accept_encoding, supported=("br", "gzip")):
+    """Function to get the preferred supported encoding of an Accept-Encoding header, None for identity."""
+    if not accept_encoding:
+        return None
+    available = [encoding for encoding in supported if encoding != "br" or get_brotli() is not None]
+    weights = {}
+    for item in accept_encoding.split(','):
+        parts = item.strip().split(';')
+        coding = parts[0].strip().lower()
+        q = 1.0
+        for param in parts[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+    best, best_q = None, 0.0
+    # the order of supported breaks ties, br compresses JSON best
+    for encoding in available:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def export_bundles(cursor, language_ids, out_dir=BUNDLE_DIR, precompressed=False):
+    """Function to write the bundles of the languages and their manifest, returning the manifest.
+
+    The gzip / brotli copies, for an upload to S3 or a CDN, are only written when precompressed is set.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {}
+    for language_id in language_ids:
+        questions_json = fetch_questions_json(cursor, language_id)
+        if questions_json is None:
+            logger.warning("No questions for language %s, no bundle written", language_id)
+            continue
+        version = version_of(questions_json)
+        data = questions_json.encode('utf-8')
+        name = "questions-%d-%s.json" % (language_id, version)
+        files = {"identity": (name, data)}
+        if precompressed:
+            files["gzip"] = (name + ".gz", compress(data, "gzip", build=True))
+            if get_brotli() is not None:
+                files["br"] = (name + ".br", compress(data, "br", build=True))
+        for file_name, content in files.values():
+            with open(join(out_dir, file_name), 'wb') as bundle:
+                bundle.write(content)
+        manifest[str(language_id)] = {
+            "version": version,
+            "files": {encoding: file_name for encoding, (file_name, _) in files.items()},
+            "bytes": {encoding: len(content) for encoding, (_, content) in files.items()},
+        }
+    # the manifest is replaced last and atomically, so a reader never sees missing files
+    temporary = join(out_dir, MANIFEST_FILE + ".tmp")
+    with open(temporary, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(temporary, join(out_dir, MANIFEST_FILE))
+    return manifest
+
+
+def load_bundles(bundle_dir=BUNDLE_DIR):
+    """Function to read the deployed bundles, skipping the unreadable ones and the ones whose content
+    does not match their version (their languages are then served from the database)."""
+    bundles = {}
+    try:
+        with open(join(bundle_dir, MANIFEST_FILE)) as manifest_file:
+            manifest = json.load(manifest_file)
+    except FileNotFoundError:
+        return bundles
+    except ValueError:
+        logger.error("Unreadable question bundle manifest, bundles ignored", exc_info=True)
+        return bundles
+    for language_id, entry in manifest.items():
+        try:
+            with open(join(bundle_dir, entry["files"]["identity"]), encoding='utf-8') as bundle:
+                questions_json = bundle.read()
+        except (OSError, KeyError, TypeError):
+            logger.error("Unreadable question bundle of language %s, ignored", language_id, exc_info=True)
+            continue
+        if version_of(questions_json) != entry["version"]:
+            logger.error("Question bundle of language %s does not match its version, ignored", language_id)
+            continue
+        bundles[int(language_id)] = (questions_json, entry["version"])
+    return bundles
+
+
+def get_bundle(language_id):
+    """Function to get the (questions JSON, version) of a language from the deployed bundles, None if there is none."""
+    global _bundles
+    if _bundles is None:
+        _bundles = load_bundles()
+    return _bundles.get(language_id)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Export the question bundles of ProfilesGetQuestions")
+    parser.add_argument('--output', default=BUNDLE_DIR, help="directory of the bundles (default: bundles/)")
+    parser.add_argument('--languages', nargs='+', type=int,
+                        help="language_ids to export (default: every language of languages.properties)")
+    parser.add_argument('--precompressed', action='store_true',
+                        help="also write .gz / .br copies, for an upload to S3 or a CDN (not needed by the handler)")
+    args = parser.parse_args()
+
+    from profiles_common import db_connection
+    import language_resolver
+    language_ids = args.languages or sorted(set(language_resolver.load_language_table().values()))
+
+    cursor = db_connection.open_cursor()
+    try:
+        manifest = export_bundles(cursor, language_ids, args.output, args.precompressed)
+    finally:
+        db_connection.release_cursor(cursor)
+    for language_id, entry in sorted(manifest.items()):
+        print("%s %s %s" % (language_id, entry["version"],
+                            " ".join("%s=%dB" % item for item in sorted(entry["bytes"].items()))))
+    if args.precompressed and get_brotli() is None:
+        print("brotli is not installed, no .br bundles were written", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Module to serve the number of active users from a refreshed snapshot.
+
+It provides the following functionalities:
+1. get_cached_count(): Returning the snapshot while it is younger than USER_COUNT_TTL seconds
+2. refresh_count(): Reading the count from the configured source and storing it as the new snapshot
+
+The source is chosen with the USER_COUNT_SOURCE environment variable:
+- exact: SELECT COUNT(*) over the active users (index scan of `users`)
+- counter_row: the `active_users` row of `user_counters`, kept up to date by the
+  triggers of schema/migrations/0001_user_counters.sql
+- estimate: the InnoDB row estimate of `users` from information_schema, which
+  counts inactive users too and can be off by a few percent
+
+Freshness bound: a served count is at most USER_COUNT_TTL seconds older than
+its source. The snapshot is refreshed inline by the first request after it
+expires, since a frozen Lambda container cannot refresh it in the background.
+"""
+
+import time
+from os import environ
+
+USER_COUNT_SOURCE = environ.get('USER_COUNT_SOURCE', 'exact')
+USER_COUNT_TTL    = float(environ.get('USER_COUNT_TTL', '300'))
+
+# Queries reading the count, by source
+COUNT_QUERIES = {
+    "exact": "SELECT COUNT(*) FROM `users` WHERE `is_active`=1",
+    "counter_row": "SELECT `value` FROM `user_counters` WHERE `name`='active_users'",
+    "estimate": "SELECT `TABLE_ROWS` FROM `information_schema`.`TABLES` WHERE `TABLE_SCHEMA`=DATABASE() AND `TABLE_NAME`='users'",
+}
+
+if USER_COUNT_SOURCE not in COUNT_QUERIES:
+    raise ValueError("USER_COUNT_SOURCE must be one of %s" % ", ".join(sorted(COUNT_QUERIES)))
+
+# snapshot kept across warm invocations: (monotonic time it was read, count)
+_snapshot = None
+
+
+def get_cached_count():
+    """Function to get the snapshot of the count, None if it is missing or expired."""
+    if _snapshot is not None and time.monotonic() - _snapshot[0] < USER_COUNT_TTL:
+        return _snapshot[1]
+    return None
+
+
+def refresh_count(cursor):
+    """Function to read the count from the configured source and store it as the snapshot."""
+    global _snapshot
+    cursor.execute(COUNT_QUERIES[USER_COUNT_SOURCE])
+    total_user_count = int(cursor.fetchone()[0])
+    _snapshot = (time.monotonic(), total_user_count)
+    return total_user_count
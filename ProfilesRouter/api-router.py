@@ -0,0 +1,131 @@
+"""API Module serving the three Profiles APIs from one Lambda function.
+
+It provides the following functionalities:
+1. ROUTES: API Gateway resources -> name of the handler serving them (ROUTER_ROUTES adds or overrides some)
+2. log_err(): Logging error and returning the prebuilt JSON response with error message & status code
+3. route_of(): Getting the handler name of an event from its routeKey, resource or path
+4. get_handler(): Importing the handler module of a function on first use, once per container
+5. prime_caches(): Importing every handler and priming the caches of the ones that have any
+6. handler(): Answering the pings of the lambda warmer and dispatching the other events
+   to the handler() of their route
+
+The handlers are the unchanged modules of ProfilesActiveNotifications, ProfilesDeletePicture
+and ProfilesGetQuestions, which keep working as functions of their own. Deployed as one
+function they share a container: one DB connection (profiles_common.db_connection), one
+verified token cache (profiles_common.jwt_auth) and the warm state of every handler, so a
+rarely called endpoint is served by containers kept warm by the busy ones. A handler
+module is only imported by the first request of its route, unless ROUTER_PRELOAD=1 or
+the container is warmed up. Metrics keep the function name of each handler.
+
+Package the function with the repository layout (ProfilesRouter next to the handler
+directories) and the handler `ProfilesRouter/api-router.handler`, or point
+ROUTER_FUNCTIONS_ROOT at the directory holding the handler directories.
+"""
+
+import sys
+import json
+import logging
+import importlib
+from os import environ
+from os.path import abspath, dirname, join
+from profiles_common import warmup, structured_log
+from profiles_common.message_catalog import MessageCatalog
+
+# compiling the response messages of the property file, per language
+messages = MessageCatalog(join(dirname(__file__), 'router.properties'), status_codes={'ROUTE_NOT_FOUND': 404})
+
+# handler name -> (function directory, handler module)
+HANDLERS = {
+    "getactivenotifications": ("ProfilesActiveNotifications", "api-getactivenotifications"),
+    "deletepicture": ("ProfilesDeletePicture", "api-deletepicture"),
+    "getquestions": ("ProfilesGetQuestions", "api-getquestions"),
+}
+
+# API Gateway resource -> handler name
+ROUTES = {
+    "/notifications/active": "getactivenotifications",
+    "/profile/picture": "deletepicture",
+    "/questions": "getquestions",
+}
+# resources of the deployed API, e.g. {"/v1/questions": "getquestions"}
+ROUTES.update(json.loads(environ.get('ROUTER_ROUTES', '{}')))
+
+# directory holding the handler directories
+FUNCTIONS_ROOT = environ.get('ROUTER_FUNCTIONS_ROOT', dirname(dirname(abspath(__file__))))
+for directory, _ in HANDLERS.values():
+    # the handlers import the modules of their own directory
+    path = join(FUNCTIONS_ROOT, directory)
+    if path not in sys.path:
+        sys.path.append(path)
+
+#Logger key
+logging_Level = int(environ.get('LOGGING_LEVEL'))
+
+# Getting the logger to log the messages for debugging purposes
+logger   = logging.getLogger()
+# Setting the log level to INFO
+logger.setLevel(logging_Level)
+# Writing the records as sampled, redacted JSON lines
+structured_log.install(logger)
+
+# handler name -> imported handler module of this container
+modules = {}
+
+
+def log_err(message_key, language_id=None):
+    """Function to log the error messages."""
+    logger.info(message_key)
+    return messages.error(message_key, language_id)
+
+
+def get_handler(name):
+    """Function to get the handler module of a function, importing it on first use."""
+    module = modules.get(name)
+    if module is None:
+        module = modules[name] = importlib.import_module(HANDLERS[name][1])
+        logger.info("Handler %s loaded", name)
+    return module
+
+
+def route_of(event):
+    """Function to get the name of the handler serving an event, None for an unknown route."""
+    # HTTP APIs send "GET /questions", REST APIs the resource and its path
+    route_key = event.get('routeKey')
+    if route_key and route_key != '$default':
+        name = ROUTES.get(route_key.split(' ', 1)[-1])
+        if name is not None:
+            return name
+    for resource in (event.get('resource'), (event.get('requestContext') or {}).get('resourcePath'),
+                     event.get('rawPath'), event.get('path')):
+        if resource in ROUTES:
+            return ROUTES[resource]
+    return None
+
+
+def prime_caches(cursor):
+    """Function to import every handler and fill the caches of the ones that have any."""
+    for name in HANDLERS:
+        prime = getattr(get_handler(name), 'prime_caches', None)
+        if prime is not None:
+            prime(cursor)
+
+
+if environ.get('ROUTER_PRELOAD') == '1':
+    # paying the imports of every handler in the init phase instead of their first request
+    for name in HANDLERS:
+        get_handler(name)
+
+logger.info("Cold start complete.")
+
+
+def handler(event, context):
+    """Function to dispatch the request to the handler of its route."""
+    # answering the pings of the lambda warmer for every handler at once
+    if warmup.is_warmup(event):
+        return warmup.handle(event, context, prime=prime_caches)
+
+    name = route_of(event) if isinstance(event, dict) else None
+    if name is None:
+        return log_err('ROUTE_NOT_FOUND')
+    # the handlers record their metrics under their own function name
+    return get_handler(name).handler(event, context)
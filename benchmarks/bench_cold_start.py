@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+"""Benchmark of the cold start (module initialization) of the three handlers.
+
+For every handler it starts fresh interpreters that import the handler module the
+way the Lambda runtime does, and reports:
+1. the init time of the module (median / min / max over the runs)
+2. the `python -X importtime` breakdown of the slowest imports of one run
+3. which heavy modules (profiles_common.lazy_imports.HEAVY_MODULES) were loaded by the init
+4. the import time of each heavy module on its own, i.e. the cost deferred to the first request that needs it
+
+Usage: python benchmarks/bench_cold_start.py [--runs N] [--top N] [--output results.json]
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+LAYER = os.path.join(ROOT, 'ProfilesCommon', 'python')
+
+HANDLERS = {
+    "ProfilesActiveNotifications": "api-getactivenotifications",
+    "ProfilesDeletePicture": "api-deletepicture",
+    "ProfilesGetQuestions": "api-getquestions",
+}
+
+# environment the handlers need to initialize, no connection is made at import time
+HANDLER_ENV = {
+    "LOGGING_LEVEL": "40",
+    "PORT": "3306",
+    "ENDPOINT": "localhost",
+    "TOKEN_SECRET_KEY": "benchmark",
+    "ENVIRONMENT_TYPE": "Bench",
+}
+
+# imports the handler and prints its init time and the heavy modules it loaded
+INIT_SCRIPT = """
+import sys, json, time, importlib
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+elapsed = time.perf_counter() - start
+from profiles_common import lazy_imports
+print(json.dumps({"init_ms": elapsed * 1000, "heavy_loaded": lazy_imports.loaded()}))
+"""
+
+# imports one module and prints its import time, or null when it is not installed
+MODULE_SCRIPT = """
+import sys, json, time, importlib
+start = time.perf_counter()
+try:
+    importlib.import_module(sys.argv[1])
+    print(json.dumps(time.perf_counter() - start))
+except ImportError:
+    print("null")
+"""
+
+
+def run(script, argument, cwd, importtime=False):
+    """Function to run a script in a fresh interpreter, returning its stdout and stderr."""
+    env = dict(os.environ, **HANDLER_ENV)
+    env["PYTHONPATH"] = os.pathsep.join([LAYER, cwd] + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else []))
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", script, argument]
+    result = subprocess.run(command, cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    return result.stdout, result.stderr
+
+
+def parse_importtime(stderr, top):
+    """Function to get the slowest top level imports of an -X importtime log."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # nested imports are indented under the module importing them
+        name = name[1:]
+        if name.startswith(" "):
+            continue
+        entries.append({"module": name, "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    entries.sort(key=lambda entry: entry["cumulative_us"], reverse=True)
+    return entries[:top]
+
+
+def bench_handler(directory, module, runs, top):
+    """Function to measure the cold start of one handler."""
+    cwd = os.path.join(ROOT, directory)
+    samples, heavy_loaded = [], []
+    for _ in range(runs):
+        stdout, _ = run(INIT_SCRIPT, module, cwd)
+        result = json.loads(stdout)
+        samples.append(result["init_ms"])
+        heavy_loaded = result["heavy_loaded"]
+    _, stderr = run(INIT_SCRIPT, module, cwd, importtime=True)
+    return {
+        "init_ms": {"median": statistics.median(samples), "min": min(samples), "max": max(samples)},
+        "heavy_loaded_at_init": heavy_loaded,
+        "importtime_top": parse_importtime(stderr, top),
+    }
+
+
+def bench_heavy_modules(runs):
+    """Function to measure the import time of every heavy module in a fresh interpreter."""
+    sys.path.insert(0, LAYER)
+    from profiles_common.lazy_imports import HEAVY_MODULES
+    results = {}
+    for name in HEAVY_MODULES:
+        samples = [json.loads(run(MODULE_SCRIPT, name, ROOT)[0]) for _ in range(runs)]
+        results[name] = None if samples[0] is None else statistics.median(samples) * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {
+        "python": sys.version.split()[0],
+        "handlers": {directory: bench_handler(directory, module, args.runs, args.top) for directory, module in HANDLERS.items()},
+        "deferred_import_ms": bench_heavy_modules(args.runs),
+    }
+
+    for directory, result in results["handlers"].items():
+        print("%-30s init %7.2f ms (min %.2f, max %.2f)  heavy modules loaded: %s" % (
+            directory, result["init_ms"]["median"], result["init_ms"]["min"], result["init_ms"]["max"],
+            ", ".join(result["heavy_loaded_at_init"]) or "none"))
+    for name, elapsed in results["deferred_import_ms"].items():
+        print("%-30s deferred import %s" % (name, "not installed" if elapsed is None else "%.2f ms" % elapsed))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+"""Benchmark of the three Profiles APIs deployed as three functions or as ProfilesRouter.
+
+It provides the following functionalities:
+1. measure(): Running one harness container of each handler and one of the router, to get
+   their init time and the latency of first and warm requests of every API
+2. make_trace(): Drawing a day (--duration) of Poisson arrivals of each API at its --rate
+3. simulate(): Replaying the trace against the Lambda containers of a deployment: a request is
+   served by an idle container of its function, or starts a new one (cold start), and a
+   container idle for --idle-minutes is reclaimed
+4. Reporting, for both deployments, the cold start rate of every API, the containers started
+   (each opens one DB connection), the peak of containers alive (open DB connections) and the
+   latency of the requests, as JSON
+
+The latencies come from the real handlers running against the fakes of run_harness.py, the
+scheduling of the containers is simulated. Lambda does not document when it reclaims an idle
+container, --idle-minutes is an assumption to vary.
+
+Usage: python benchmarks/harness/bench_router.py [--rate getquestions=1.0 ...] [--duration 86400]
+                                                 [--idle-minutes 10] [--output results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import argparse
+import tempfile
+import statistics
+import multiprocessing
+
+HARNESS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HARNESS)
+import seed
+import run_harness
+
+APIS = ("getactivenotifications", "deletepicture", "getquestions")
+ROUTER = "router"
+
+# requests per second of each API, delete-picture being the rarely called one
+DEFAULT_RATES = {"getquestions": 0.5, "getactivenotifications": 0.2, "deletepicture": 0.002}
+
+
+def measure(options, users, requests):
+    """Function to get the init, first request and warm request latencies (ms) of the handlers and of the router."""
+    context = multiprocessing.get_context("spawn")
+    names = list(APIS) + [ROUTER]
+    with context.Pool(len(names), maxtasksperchild=1) as pool:
+        containers = pool.starmap(run_harness.run_container,
+                                  [(name, 0, requests, users, dict(options, allocations=False)) for name in names])
+    latencies = {}
+    for name, container in zip(names, containers):
+        first, warm = {}, {}
+        for record in container["records"]:
+            if record["status"] != 200:
+                raise RuntimeError("%s answered %s to the benchmark traffic" % (name, record["status"]))
+            # the first request of an API in a router container also imports its handler
+            if record["route"] in first:
+                warm.setdefault(record["route"], []).append(record["ms"])
+            else:
+                first[record["route"]] = record["ms"]
+        latencies[name] = {"init_ms": container["init_ms"], "first_ms": first,
+                           "warm_ms": {route: statistics.median(samples) for route, samples in warm.items()}}
+    for api in APIS:
+        # an API the router replayed once (or never) is timed like its own function
+        latencies[ROUTER]["first_ms"].setdefault(api, latencies[api]["first_ms"][api])
+        latencies[ROUTER]["warm_ms"].setdefault(api, latencies[api]["warm_ms"][api])
+    return latencies
+
+
+def make_trace(rates, duration, rng):
+    """Function to get the (time in seconds, API) of the requests, Poisson arrivals of each API."""
+    trace = []
+    for api, rate in rates.items():
+        if rate <= 0:
+            continue
+        t = rng.expovariate(rate)
+        while t < duration:
+            trace.append((t, api))
+            t += rng.expovariate(rate)
+    trace.sort()
+    return trace
+
+
+def simulate(trace, latencies, routed, idle_seconds):
+    """Function to replay the trace against the containers of the three functions, or of the router when routed."""
+    # function -> containers as [last request end, loaded APIs]
+    pools = {}
+    # (reclaim time, function, container id) of the idle containers
+    reclaims = []
+    alive = peak = started = 0
+    cold = {api: 0 for api in APIS}
+    served = {api: 0 for api in APIS}
+    handler_loads = 0
+    durations = []
+    next_id = 0
+
+    for t, api in trace:
+        # reclaiming the containers idle for too long, so that the alive count is right
+        while reclaims and reclaims[0][0] <= t:
+            _, function, container_id = heapq.heappop(reclaims)
+            pool = pools[function]
+            if container_id in pool and pool[container_id][0] + idle_seconds <= t:
+                del pool[container_id]
+                alive -= 1
+
+        function = ROUTER if routed else api
+        measured = latencies[function]
+        pool = pools.setdefault(function, {})
+        # the most recently used idle container serves the request
+        idle = [(state[0], container_id) for container_id, state in pool.items() if state[0] <= t]
+        if idle:
+            _, container_id = max(idle)
+            state = pool[container_id]
+            if api in state[1]:
+                ms = measured["warm_ms"][api]
+            else:
+                # a router container serving this API for the first time imports its handler
+                ms = measured["first_ms"][api]
+                handler_loads += 1
+        else:
+            container_id, next_id = next_id, next_id + 1
+            state = pool[container_id] = [t, set()]
+            ms = measured["init_ms"] + measured["first_ms"][api]
+            cold[api] += 1
+            started += 1
+            alive += 1
+            peak = max(peak, alive)
+        state[1].add(api)
+        state[0] = t + ms / 1000.0
+        heapq.heappush(reclaims, (state[0] + idle_seconds, function, container_id))
+        served[api] += 1
+        durations.append(ms)
+
+    return {
+        "requests": served,
+        "cold_starts": cold,
+        "cold_start_rate": {api: cold[api] / served[api] if served[api] else None for api in APIS},
+        "cold_start_rate_total": sum(cold.values()) / max(1, len(trace)),
+        "handler_loads": handler_loads,
+        "containers_started": started,
+        "connections_opened": started,
+        "peak_connections": peak,
+        "latency_ms": run_harness.percentiles(durations),
+    }
+
+
+def print_summary(results):
+    """Function to print the cold start rate and the connections of both deployments."""
+    print("%-14s %-24s %9s %12s %10s" % ("deployment", "api", "requests", "cold starts", "cold rate"))
+    for deployment in ("functions", "router"):
+        result = results[deployment]
+        for api in APIS:
+            rate = result["cold_start_rate"][api]
+            print("%-14s %-24s %9d %12d %9s" % (deployment, api, result["requests"][api], result["cold_starts"][api],
+                                                "-" if rate is None else "%.2f%%" % (100 * rate)))
+        print("%-14s containers started (DB connections opened) %d, peak DB connections %d, "
+              "p99 latency %.2f ms" % (deployment, result["containers_started"], result["peak_connections"],
+                                       result["latency_ms"].get("p99", 0)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rate', action='append', default=[], metavar='API=RPS',
+                        help="requests per second of an API, may be repeated (default %s)" %
+                             ", ".join("%s=%s" % item for item in sorted(DEFAULT_RATES.items())))
+    parser.add_argument('--duration', type=float, default=86400, help="seconds of traffic simulated")
+    parser.add_argument('--idle-minutes', type=float, default=10, help="idle time after which a container is reclaimed")
+    parser.add_argument('--requests', type=int, default=100, help="requests replayed to measure the latencies")
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--notifications', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    rates = dict(DEFAULT_RATES)
+    for item in args.rate:
+        api, value = item.split("=", 1)
+        if api not in APIS:
+            parser.error("unknown API %s" % api)
+        rates[api] = float(value)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_file = os.path.join(workdir, "harness.sqlite")
+        users = seed.seed(db_file, users=args.users, notifications=args.notifications, seed_value=args.seed)
+        options = {
+            "db_file": db_file, "db_rtt_ms": 0.5, "db_connect_ms": 8.0, "aws_rtt_ms": 15.0, "seed": args.seed,
+            "users_per_container": 50, "warmup": False, "env": {},
+        }
+        started = time.perf_counter()
+        latencies = measure(options, users, args.requests)
+        print("Measured the handlers and the router in %.1f s" % (time.perf_counter() - started))
+
+    trace = make_trace(rates, args.duration, random.Random(args.seed))
+    idle_seconds = args.idle_minutes * 60
+    results = {
+        "commit": run_harness.git_commit(),
+        "config": {"rates": rates, "duration": args.duration, "idle_minutes": args.idle_minutes, "seed": args.seed},
+        "latencies": latencies,
+        "functions": simulate(trace, latencies, False, idle_seconds),
+        "router": simulate(trace, latencies, True, idle_seconds),
+    }
+    print_summary(results)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
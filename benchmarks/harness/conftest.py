@@ -0,0 +1,83 @@
+"""Fixtures of the scenario checks run against the harness stand-ins.
+
+It provides the following functionalities:
+1. Putting the fakes of fakes/ and the ProfilesCommon layer on the path, with no simulated
+   network cost, before any handler module is imported
+2. database: A small seeded SQLite database used by the fake pymysql, and an sqlite3
+   connection to it for the assertions
+3. load_handler() / make_token(): Importing a handler and making the token of a seeded user
+4. Resetting the connections and replica state of profiles_common.db_connection between checks
+
+Usage: python -m pytest benchmarks/harness
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import importlib
+
+import pytest
+
+HARNESS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.normpath(os.path.join(HARNESS, '..', '..'))
+
+os.environ.update({
+    "HARNESS_DB_CONNECT_MS": "0",
+    "HARNESS_DB_RTT_MS": "0",
+    "HARNESS_AWS_RTT_MS": "0",
+    "ENDPOINT": "primary",
+    "PORT": "3306",
+    "BUCKET_NAME": "harness-bucket",
+    "LOGGING_LEVEL": "40",
+    "TOKEN_SECRET_KEY": "harness-secret",
+    "ENVIRONMENT_TYPE": "Harness",
+})
+sys.path[:0] = [HARNESS, os.path.join(HARNESS, 'fakes'), os.path.join(ROOT, 'ProfilesCommon', 'python')]
+
+import jwt
+import seed
+import pymysql
+from profiles_common import db_connection
+
+
+def add_function_path(directory):
+    """Function to make the modules of a function directory importable."""
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def load_handler(directory, module_name):
+    """Function to import the handler module of a function directory."""
+    add_function_path(directory)
+    return importlib.import_module(module_name)
+
+
+def make_token(rid, user_id, language_id=165):
+    """Function to get a valid Authorization token of the user."""
+    return jwt.encode({"id": rid, "user_id": user_id, "language_id": language_id, "exp": int(time.time()) + 3600},
+                      os.environ["TOKEN_SECRET_KEY"])
+
+
+def reset_connections():
+    """Function to forget the connections and the replica state of the container."""
+    db_connection.close_connection()
+    db_connection.close_read_connection()
+    db_connection._replica_down.clear()
+    db_connection._replica_latency.clear()
+    for name in db_connection.stats:
+        db_connection.stats[name] = 0
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Function to get an sqlite3 connection to a freshly seeded database the fake pymysql uses."""
+    path = str(tmp_path / "harness.sqlite")
+    seed.seed(path, users=200, notifications=500, seed_value=1)
+    monkeypatch.setattr(pymysql, "DATABASE_FILE", path)
+    reset_connections()
+    db = sqlite3.connect(path, isolation_level=None)
+    yield db
+    db.close()
+    reset_connections()
@@ -0,0 +1,58 @@
+"""Local stand-in for boto3, with an in-memory S3 bucket and a ProfilesGetLanguage stub.
+
+Calls sleep for a simulated AWS round trip and are counted, so the harness can
+report them next to the DB queries.
+"""
+
+import io
+import os
+import json
+import time
+
+ROUND_TRIP_SECONDS = float(os.environ.get('HARNESS_AWS_RTT_MS', '15')) / 1000
+
+# objects of the local bucket, and counters read by the harness
+objects = {}
+stats = {"aws_calls": 0}
+
+
+def _round_trip():
+    stats["aws_calls"] += 1
+    time.sleep(ROUND_TRIP_SECONDS)
+
+
+class S3Client:
+    """Class standing for the boto3 s3 client."""
+
+    def put_object(self, Bucket, Key, Body=b""):
+        _round_trip()
+        objects[(Bucket, Key)] = Body
+        return {}
+
+    def delete_object(self, Bucket, Key):
+        _round_trip()
+        objects.pop((Bucket, Key), None)
+        return {"ResponseMetadata": {"HTTPStatusCode": 204}}
+
+    def delete_objects(self, Bucket, Delete):
+        _round_trip()
+        keys = [item["Key"] for item in Delete["Objects"]]
+        if len(keys) > 1000:
+            raise ValueError("MalformedXML: more than 1000 keys")
+        for key in keys:
+            objects.pop((Bucket, key), None)
+        return {} if Delete.get("Quiet") else {"Deleted": [{"Key": key} for key in keys]}
+
+
+class LambdaClient:
+    """Class standing for the boto3 lambda client, answering for ProfilesGetLanguage."""
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        _round_trip()
+        body = json.dumps({"language_id": 165})
+        return {"Payload": io.BytesIO(json.dumps({"statusCode": 200, "body": body}).encode('utf-8'))}
+
+
+def client(service_name, **kwargs):
+    """Function to get the stand-in client of a service."""
+    return {"s3": S3Client, "lambda": LambdaClient}[service_name]()
@@ -0,0 +1,8 @@
+"""Local stand-in for botocore.client."""
+
+
+class Config:
+    """Class standing for the botocore client configuration."""
+
+    def __init__(self, **kwargs):
+        self.options = kwargs
@@ -0,0 +1,59 @@
+"""Local stand-in for PyJWT, implementing HS256 encode / decode with the same API.
+
+The signature is really computed and checked, so the harness still pays the
+cost of verifying a token.
+"""
+
+import hmac
+import json
+import time
+import base64
+import hashlib
+
+
+class InvalidTokenError(Exception):
+    pass
+
+
+class ExpiredSignatureError(InvalidTokenError):
+    pass
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + b'=' * (-len(text) % 4))
+
+
+def _sign(signing_input, key):
+    return hmac.new(key.encode('utf-8'), signing_input, hashlib.sha256).digest()
+
+
+def encode(payload, key, algorithm='HS256'):
+    """Function to make an HS256 token of the payload."""
+    header = _b64encode(json.dumps({"alg": algorithm, "typ": "JWT"}).encode('utf-8'))
+    body = _b64encode(json.dumps(payload).encode('utf-8'))
+    signing_input = header + b'.' + body
+    return (signing_input + b'.' + _b64encode(_sign(signing_input, key))).decode('ascii')
+
+
+def decode(token, key, options=None, algorithms=None):
+    """Function to verify an HS256 token and return its payload."""
+    options = options or {}
+    if isinstance(token, str):
+        token = token.encode('ascii')
+    try:
+        signing_input, signature = token.rsplit(b'.', 1)
+        payload = json.loads(_b64decode(signing_input.split(b'.', 1)[1]))
+    except ValueError as e:
+        raise InvalidTokenError("Invalid token") from e
+    if not hmac.compare_digest(_sign(signing_input, key), _b64decode(signature)):
+        raise InvalidTokenError("Signature verification failed")
+    if 'exp' not in payload:
+        if options.get('require_exp'):
+            raise InvalidTokenError('Token is missing the "exp" claim')
+    elif payload['exp'] < time.time():
+        raise ExpiredSignatureError("Signature has expired")
+    return payload
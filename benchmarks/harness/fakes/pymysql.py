@@ -0,0 +1,150 @@
+"""Local stand-in for pymysql, backed by the SQLite database seeded by the harness.
+
+It implements the part of the pymysql API the handlers use (connect, ping, cursor,
+begin / commit / rollback, execute / fetchone / fetchall / iteration) and
+translates the MySQL dialect the handlers speak into SQLite:
+- %s placeholders become ?
+- ON DUPLICATE KEY UPDATE becomes ON CONFLICT DO UPDATE SET
+
+Every connection and statement sleeps for the simulated handshake / round trip
+time and is counted, so the harness can report queries per request and
+connections opened.
+
+Every host (primary or replica) is the same SQLite file. HARNESS_DOWN_HOSTS lists
+hosts refusing connections and HARNESS_REPLICA_LAG maps hosts to the
+Seconds_Behind_Source of their SHOW REPLICA STATUS (null when not replicating),
+so that the replica routing of db_connection can be exercised.
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+
+# SQLite file seeded by the harness, and the simulated network costs
+DATABASE_FILE = os.environ.get('HARNESS_DB_FILE', 'harness.sqlite')
+CONNECT_SECONDS = float(os.environ.get('HARNESS_DB_CONNECT_MS', '8')) / 1000
+ROUND_TRIP_SECONDS = float(os.environ.get('HARNESS_DB_RTT_MS', '0.5')) / 1000
+DOWN_HOSTS = set(filter(None, os.environ.get('HARNESS_DOWN_HOSTS', '').split(',')))
+REPLICA_LAG = json.loads(os.environ.get('HARNESS_REPLICA_LAG', '{}'))
+
+# counters read by the harness
+stats = {"connections": 0, "queries": 0, "hosts": {}}
+
+
+class err:
+    """Exception classes of pymysql.err."""
+
+    class MySQLError(Exception):
+        pass
+
+    class OperationalError(MySQLError):
+        pass
+
+    class InterfaceError(MySQLError):
+        pass
+
+
+def _translate(query):
+    """Function to translate a MySQL statement into SQLite."""
+    query = query.replace("%s", "?")
+    return re.sub(r"ON DUPLICATE KEY UPDATE", "ON CONFLICT DO UPDATE SET", query)
+
+
+class Connection:
+    """Class standing for a pymysql connection."""
+
+    def __init__(self, **kwargs):
+        time.sleep(CONNECT_SECONDS)
+        self.host = kwargs.get('host')
+        if self.host in DOWN_HOSTS:
+            raise err.OperationalError(2003, "Can't connect to MySQL server on '%s'" % self.host)
+        # isolation_level None keeps SQLite in autocommit mode like autocommit=True
+        self._db = sqlite3.connect(DATABASE_FILE, isolation_level=None, timeout=30)
+        stats["connections"] += 1
+        stats["hosts"][self.host] = stats["hosts"].get(self.host, 0) + 1
+
+    @property
+    def open(self):
+        return self._db is not None
+
+    def _round_trip(self):
+        if self._db is None:
+            raise err.InterfaceError("(0, '')")
+        time.sleep(ROUND_TRIP_SECONDS)
+
+    def ping(self, reconnect=True):
+        self._round_trip()
+
+    def cursor(self):
+        return Cursor(self)
+
+    def begin(self):
+        self._round_trip()
+        self._db.execute("BEGIN")
+
+    def commit(self):
+        self._round_trip()
+        if self._db.in_transaction:
+            self._db.execute("COMMIT")
+
+    def rollback(self):
+        self._round_trip()
+        if self._db.in_transaction:
+            self._db.execute("ROLLBACK")
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class Cursor:
+    """Class standing for a pymysql cursor."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._rows = []
+        self.rowcount = -1
+        self.description = None
+
+    def execute(self, query, args=None):
+        self.connection._round_trip()
+        stats["queries"] += 1
+        if query == "SHOW REPLICA STATUS":
+            # an empty result on a host that is not a replica, like MySQL
+            host = self.connection.host
+            self.description = (("Seconds_Behind_Source",),)
+            self._rows = [(REPLICA_LAG[host],)] if host in REPLICA_LAG else []
+            self.rowcount = len(self._rows)
+            return self.rowcount
+        # pymysql accepts a single value as well as a sequence of values
+        if args is None:
+            args = ()
+        elif not isinstance(args, (tuple, list)):
+            args = (args,)
+        sqlite_cursor = self.connection._db.execute(_translate(query), tuple(args))
+        self.description = sqlite_cursor.description
+        self._rows = [tuple(row) for row in sqlite_cursor.fetchall()]
+        self.rowcount = len(self._rows) if sqlite_cursor.description else sqlite_cursor.rowcount
+        return self.rowcount
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return tuple(rows)
+
+    def __iter__(self):
+        rows, self._rows = self._rows, []
+        return iter(rows)
+
+    def close(self):
+        self._rows = []
+
+
+def connect(**kwargs):
+    """Function to open a connection to the harness database."""
+    return Connection(**kwargs)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+"""Offline end-to-end benchmark and load harness for the Profiles handlers.
+
+It provides the following functionalities:
+1. Seeding a local SQLite stand-in of the MySQL schema with realistic volumes (seed.py)
+2. Running each handler in N concurrent containers, each one a fresh interpreter using the
+   stand-ins of fakes/ for pymysql, jwt and boto3 (local S3 bucket and ProfilesGetLanguage)
+3. Replaying the recorded API Gateway events of events/ against each container, the first
+   request of a container being its cold start
+4. Reporting p50 / p95 / p99 latency of cold and warm requests, DB queries and AWS calls per
+   request, connections opened and allocations per request, as JSON
+
+With --warmup every container first answers a lambda warmer ping, so its first
+request shows what a container primed by profiles_common.warmup serves. The
+"router" handler is ProfilesRouter serving the three APIs from one container, it
+replays a mix of their events (ROUTER_MIX). The "notificationbadge" clients poll the
+unread badge, presenting the version they got from their previous poll.
+
+Usage: python benchmarks/harness/run_harness.py [--containers N] [--requests N] [--output results.json]
+                                                [--compare previous.json] [--warmup]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import importlib
+import statistics
+import subprocess
+import tracemalloc
+import multiprocessing
+
+HARNESS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.normpath(os.path.join(HARNESS, '..', '..'))
+LAYER = os.path.join(ROOT, 'ProfilesCommon', 'python')
+FAKES = os.path.join(HARNESS, 'fakes')
+EVENTS = os.path.join(HARNESS, 'events')
+
+sys.path.insert(0, HARNESS)
+import seed
+
+# handler name -> (function directory, handler module, recorded event)
+HANDLERS = {
+    "getactivenotifications": ("ProfilesActiveNotifications", "api-getactivenotifications", "getactivenotifications.json"),
+    "notificationbadge": ("ProfilesActiveNotifications", "api-getactivenotifications", "notificationbadge.json"),
+    "deletepicture": ("ProfilesDeletePicture", "api-deletepicture", "deletepicture.json"),
+    "getquestions": ("ProfilesGetQuestions", "api-getquestions", "getquestions.json"),
+    "router": ("ProfilesRouter", "api-router", None),
+}
+
+# share of the requests of each API in the traffic replayed against the router
+ROUTER_MIX = (("getquestions", 6), ("getactivenotifications", 3), ("deletepicture", 1))
+
+TOKEN_SECRET_KEY = "harness-secret"
+
+# language headers replayed against getquestions, "null" ones go through Accept-Language
+QUESTION_LANGUAGES = (("165", "en-US,en;q=0.9"), ("245", "es-ES,es;q=0.9"), ("null", "es-MX,es;q=0.8,en;q=0.5"),
+                      ("null", "fr-FR,fr;q=0.9"))
+
+
+def percentiles(samples):
+    """Function to get the p50 / p95 / p99 (nearest rank), mean and count of samples."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    rank = lambda p: ordered[min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered))) - 1))]
+    return {"count": len(ordered), "p50": rank(50), "p95": rank(95), "p99": rank(99),
+            "mean": statistics.fmean(ordered), "max": ordered[-1]}
+
+
+def make_event(template, name, rng, users, jwt):
+    """Function to fill the recorded event of a handler for one request."""
+    if name == "getquestions":
+        language_id, accept_language = rng.choice(QUESTION_LANGUAGES)
+        text = template.replace("{language_id}", language_id).replace("{accept_language}", accept_language)
+    else:
+        rid, user_id = rng.choice(users)
+        token = jwt.encode({"id": rid, "user_id": user_id, "language_id": 165, "exp": int(time.time()) + 3600},
+                           TOKEN_SECRET_KEY)
+        text = template.replace("{token}", token)
+    return json.loads(text)
+
+
+def run_container(name, index, requests, users, options):
+    """Function to run one container (a fresh interpreter) serving requests one after the other."""
+    directory, module_name, event_file = HANDLERS[name]
+    os.environ.update({
+        "HARNESS_DB_FILE": options["db_file"],
+        "HARNESS_DB_RTT_MS": str(options["db_rtt_ms"]),
+        "HARNESS_DB_CONNECT_MS": str(options["db_connect_ms"]),
+        "HARNESS_AWS_RTT_MS": str(options["aws_rtt_ms"]),
+        "LOGGING_LEVEL": "40",
+        "PORT": "3306",
+        "ENDPOINT": "localhost",
+        "TOKEN_SECRET_KEY": TOKEN_SECRET_KEY,
+        "ENVIRONMENT_TYPE": "Harness",
+        "BUCKET_NAME": "harness-bucket",
+    })
+    os.environ.update(options.get("env", {}))
+    sys.path[:0] = [FAKES, LAYER, os.path.join(ROOT, directory)]
+    os.chdir(os.path.join(ROOT, directory))
+    import jwt
+    import boto3
+    import pymysql
+
+    # the router replays the events of every API
+    names = [name] if event_file else [route for route, _ in ROUTER_MIX]
+    templates = {}
+    for route in names:
+        with open(os.path.join(EVENTS, HANDLERS[route][2])) as event:
+            templates[route] = event.read()
+    rng = random.Random(options["seed"] * 1000 + index)
+    # a container serves a small set of users that poll repeatedly
+    pool = rng.sample(users, min(len(users), options["users_per_container"]))
+    routes = rng.choices(names, weights=[dict(ROUTER_MIX).get(route, 1) for route in names], k=requests)
+    events = [make_event(templates[route], route, rng, pool, jwt) for route in routes]
+
+    if options["allocations"]:
+        tracemalloc.start()
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    init_ms = (time.perf_counter() - start) * 1000
+
+    warmup_ms = None
+    if options["warmup"]:
+        start = time.perf_counter()
+        module.handler({"source": "lambda_warmer"}, None)
+        warmup_ms = (time.perf_counter() - start) * 1000
+
+    records = []
+    # badge version each polling client has seen, presented again on its next poll
+    seen_versions = {}
+    for route, event in zip(routes, events):
+        if route == "notificationbadge" and event["headers"]["Authorization"] in seen_versions:
+            event["queryStringParameters"]["version"] = seen_versions[event["headers"]["Authorization"]]
+        pymysql.stats["queries"] = 0
+        boto3.stats["aws_calls"] = 0
+        if options["allocations"]:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        response = module.handler(event, None)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        record = {"route": route, "ms": elapsed_ms, "queries": pymysql.stats["queries"], "aws_calls": boto3.stats["aws_calls"],
+                  "status": response.get("statusCode", response.get("status_code"))}
+        if options["allocations"]:
+            record["alloc_kib"] = (tracemalloc.get_traced_memory()[1] - baseline) / 1024
+        records.append(record)
+        if route == "notificationbadge" and record["status"] == 200:
+            seen_versions[event["headers"]["Authorization"]] = str(json.loads(response["body"])["version"])
+    return {"init_ms": init_ms, "warmup_ms": warmup_ms, "records": records, "connections": pymysql.stats["connections"]}
+
+
+def bench_handler(name, users, options):
+    """Function to run the containers of a handler concurrently and aggregate their requests."""
+    context = multiprocessing.get_context("spawn")
+    # one fresh interpreter per container, so that every container starts cold
+    with context.Pool(options["containers"], maxtasksperchild=1) as pool:
+        containers = pool.starmap(run_container, [(name, index, options["requests"], users, dict(options, allocations=False))
+                                                  for index in range(options["containers"])])
+        # allocations are traced in a separate container, tracing slows the requests down
+        traced = pool.apply(run_container, (name, options["containers"], min(options["requests"], 50), users,
+                                            dict(options, allocations=True)))
+
+    cold = [container["init_ms"] + container["records"][0]["ms"] for container in containers]
+    warm = [record["ms"] for container in containers for record in container["records"][1:]]
+    records = [record for container in containers for record in container["records"]]
+    statuses = {}
+    for record in records:
+        statuses[str(record["status"])] = statuses.get(str(record["status"]), 0) + 1
+    return {
+        "init_ms": percentiles([container["init_ms"] for container in containers]),
+        "warmup_ms": percentiles([container["warmup_ms"] for container in containers if container["warmup_ms"] is not None]),
+        "cold_ms": percentiles(cold),
+        "warm_ms": percentiles(warm),
+        "queries_per_request": {
+            "cold": statistics.fmean(container["records"][0]["queries"] for container in containers),
+            "warm": statistics.fmean(record["queries"] for container in containers for record in container["records"][1:]) if warm else None,
+        },
+        "aws_calls_per_request": statistics.fmean(record["aws_calls"] for record in records),
+        "connections_opened": sum(container["connections"] for container in containers),
+        "alloc_kib_per_request": percentiles([record["alloc_kib"] for record in traced["records"][1:]]),
+        "status_codes": statuses,
+    }
+
+
+def git_commit():
+    """Function to get the commit the harness runs on, None outside of a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(results, previous=None):
+    """Function to print the results, with the change from a previous run when given."""
+    print("%-24s %10s %10s %10s %10s %9s %8s %9s" % ("handler", "cold p50", "warm p50", "warm p95", "warm p99",
+                                                     "queries", "conns", "alloc KiB"))
+    for name, result in results["handlers"].items():
+        print("%-24s %10.2f %10.2f %10.2f %10.2f %9.2f %8d %9.1f" % (
+            name, result["cold_ms"]["p50"], result["warm_ms"]["p50"], result["warm_ms"]["p95"], result["warm_ms"]["p99"],
+            result["queries_per_request"]["warm"], result["connections_opened"], result["alloc_kib_per_request"]["p50"]))
+        if previous and name in previous.get("handlers", {}):
+            before = previous["handlers"][name]
+            print("%-24s %+9.1f%% %+9.1f%% %+9.1f%% %+9.1f%%" % (
+                "  vs " + (previous.get("commit") or "previous")[:12],
+                *[100.0 * (result[key][p] - before[key][p]) / before[key][p]
+                  for key, p in (("cold_ms", "p50"), ("warm_ms", "p50"), ("warm_ms", "p95"), ("warm_ms", "p99"))]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--handlers', nargs='+', choices=sorted(HANDLERS), default=sorted(HANDLERS))
+    parser.add_argument('--containers', type=int, default=4, help="concurrent containers per handler")
+    parser.add_argument('--requests', type=int, default=200, help="requests served by each container")
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--notifications', type=int, default=200000)
+    parser.add_argument('--users-per-container', type=int, default=50)
+    parser.add_argument('--db-rtt-ms', type=float, default=0.5, help="simulated DB round trip")
+    parser.add_argument('--db-connect-ms', type=float, default=8.0, help="simulated TCP + auth handshake")
+    parser.add_argument('--aws-rtt-ms', type=float, default=15.0, help="simulated S3 / Lambda call")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help="extra environment variable of the handlers, may be repeated")
+    parser.add_argument('--warmup', action='store_true', help="ping every container with the lambda warmer first")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--compare', help="results JSON of a previous run to compare with")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_file = os.path.join(workdir, "harness.sqlite")
+        started = time.perf_counter()
+        users = seed.seed(db_file, users=args.users, notifications=args.notifications, seed_value=args.seed)
+        print("Seeded %d users and %d notifications in %.1f s" % (args.users, args.notifications, time.perf_counter() - started))
+
+        options = {
+            "db_file": db_file, "db_rtt_ms": args.db_rtt_ms, "db_connect_ms": args.db_connect_ms,
+            "aws_rtt_ms": args.aws_rtt_ms, "seed": args.seed, "containers": args.containers,
+            "requests": args.requests, "users_per_container": args.users_per_container, "warmup": args.warmup,
+            "env": dict(item.split("=", 1) for item in args.env),
+        }
+        results = {
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "config": {key: value for key, value in options.items() if key != "db_file"},
+            "handlers": {name: bench_handler(name, users, options) for name in args.handlers},
+        }
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as compare:
+            previous = json.load(compare)
+    print_summary(results, previous)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
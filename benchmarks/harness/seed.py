@@ -0,0 +1,138 @@
+"""Module to create and seed the SQLite database standing for the Profiles MySQL schema.
+
+It provides the following functionalities:
+1. create_schema(): Creating the tables the handlers query, with the indexes of schema/migrations
+2. seed(): Filling them with realistic volumes of users, notifications and questions
+
+Notifications are spread with a long tail: most users have a handful of unvisited
+notifications and a few have thousands, like the production feed.
+"""
+
+import json
+import random
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE `users` (
+    `id` INTEGER PRIMARY KEY,
+    `user_id` TEXT NOT NULL UNIQUE,
+    `language_id` INTEGER NOT NULL,
+    `is_active` INTEGER NOT NULL,
+    `picture_url` TEXT,
+    `is_picture_uploaded` INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX `idx_users_is_active` ON `users` (`is_active`);
+
+CREATE TABLE `notifications` (
+    `id` INTEGER PRIMARY KEY,
+    `rid` INTEGER NOT NULL,
+    `notification_type` TEXT NOT NULL,
+    `json` TEXT NOT NULL,
+    `visited` INTEGER NOT NULL DEFAULT 0,
+    `timestamp` TEXT NOT NULL
+);
+CREATE INDEX `idx_notifications_rid_visited_timestamp` ON `notifications` (`rid`, `visited`, `timestamp`, `id`);
+
+CREATE TABLE `questions_120` (
+    `id` INTEGER PRIMARY KEY,
+    `question` TEXT NOT NULL,
+    `language_id` INTEGER NOT NULL
+);
+CREATE INDEX `idx_questions_120_language` ON `questions_120` (`language_id`, `id`);
+
+CREATE TABLE `questions_120_translations` (
+    `question_id` INTEGER NOT NULL,
+    `question` TEXT NOT NULL,
+    `language_id` INTEGER NOT NULL,
+    PRIMARY KEY (`language_id`, `question_id`)
+);
+
+CREATE TABLE `user_counters` (
+    `name` TEXT PRIMARY KEY,
+    `value` INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE `picture_deletions` (
+    `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+    `object_key` TEXT NOT NULL UNIQUE,
+    `user_id` TEXT NOT NULL,
+    `attempts` INTEGER NOT NULL DEFAULT 0,
+    `next_attempt_at` TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    `last_error` TEXT,
+    `created_at` TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX `idx_picture_deletions_due` ON `picture_deletions` (`next_attempt_at`, `attempts`);
+
+CREATE TABLE `notification_badges` (
+    `rid` INTEGER PRIMARY KEY,
+    `unread` INTEGER NOT NULL DEFAULT 0,
+    `version` INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# backfill and triggers of schema/migrations/0004_notification_badges.sql, run once the notifications are seeded
+BADGE_TRIGGERS = """
+INSERT INTO `notification_badges` (`rid`, `unread`, `version`)
+    SELECT `rid`, SUM(`visited` = 0), 1 FROM `notifications` GROUP BY `rid`;
+
+CREATE TRIGGER `notifications_badge_insert` AFTER INSERT ON `notifications` FOR EACH ROW BEGIN
+    INSERT INTO `notification_badges` (`rid`, `unread`, `version`) VALUES (NEW.`rid`, (NEW.`visited` = 0), 1)
+    ON CONFLICT (`rid`) DO UPDATE SET `unread` = `unread` + (NEW.`visited` = 0), `version` = `version` + 1;
+END;
+
+CREATE TRIGGER `notifications_badge_update` AFTER UPDATE OF `visited` ON `notifications` FOR EACH ROW
+WHEN NEW.`visited` <> OLD.`visited` BEGIN
+    UPDATE `notification_badges` SET `unread` = `unread` + (NEW.`visited` = 0) - (OLD.`visited` = 0), `version` = `version` + 1
+    WHERE `rid`=NEW.`rid`;
+END;
+
+CREATE TRIGGER `notifications_badge_delete` AFTER DELETE ON `notifications` FOR EACH ROW BEGIN
+    UPDATE `notification_badges` SET `unread` = `unread` - (OLD.`visited` = 0), `version` = `version` + 1
+    WHERE `rid`=OLD.`rid`;
+END;
+"""
+
+NOTIFICATION_TYPES = ("friend_request", "friend_accepted", "comparison_ready", "message")
+
+
+def create_schema(db):
+    """Function to create the tables of the harness database."""
+    db.executescript(SCHEMA)
+
+
+def seed(path, users=20000, notifications=200000, active_ratio=0.8, seed_value=1):
+    """Function to create the database file at path and fill it, returning the seeded (id, user_id) pairs."""
+    rng = random.Random(seed_value)
+    db = sqlite3.connect(path)
+    # WAL lets the concurrent containers read while another one writes
+    db.execute("PRAGMA journal_mode=WAL")
+    create_schema(db)
+
+    user_rows = [(i, "user-%06d" % i, rng.choice((165, 165, 165, 245)), int(rng.random() < active_ratio),
+                  "https://bucket.example.com/user-%06d.png" % i, 1) for i in range(1, users + 1)]
+    db.executemany("INSERT INTO `users` VALUES (?, ?, ?, ?, ?, ?)", user_rows)
+    db.execute("INSERT INTO `user_counters` VALUES ('active_users', ?)", (sum(row[3] for row in user_rows),))
+
+    notification_rows = []
+    for i in range(1, notifications + 1):
+        # pareto distributed recipients give a few users very long feeds
+        rid = min(users, int(rng.paretovariate(1.2)))
+        rid = rid if rng.random() < 0.3 else rng.randint(1, users)
+        sender = rng.randint(1, users)
+        payload = {"sender_id": sender, "sender_name": "User %d" % sender,
+                   "picture_url": "https://bucket.example.com/user-%06d.png" % sender,
+                   "message": "has a new notification for you", "meta": {"score": rng.random()}}
+        timestamp = "2024-%02d-%02d %02d:%02d:%02d" % (rng.randint(1, 12), rng.randint(1, 28), rng.randint(0, 23),
+                                                        rng.randint(0, 59), rng.randint(0, 59))
+        notification_rows.append((i, rid, rng.choice(NOTIFICATION_TYPES), json.dumps(payload),
+                                  int(rng.random() < 0.5), timestamp))
+    db.executemany("INSERT INTO `notifications` VALUES (?, ?, ?, ?, ?, ?)", notification_rows)
+    db.executescript(BADGE_TRIGGERS)
+
+    db.executemany("INSERT INTO `questions_120` VALUES (?, ?, 165)",
+                   [(i, "Question %d: I see myself as someone who ..." % i) for i in range(1, 121)])
+    db.executemany("INSERT INTO `questions_120_translations` VALUES (?, ?, 245)",
+                   [(i, "Pregunta %d: Me veo como alguien que ..." % i) for i in range(1, 121)])
+    db.commit()
+    db.close()
+    return [(row[0], row[1]) for row in user_rows]
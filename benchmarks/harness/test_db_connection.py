@@ -0,0 +1,110 @@
+"""Checks of profiles_common.db_connection against the harness stand-ins.
+
+The replica checks point REPLICA_ENDPOINTS at hosts of the fake pymysql, whose
+DOWN_HOSTS and REPLICA_LAG (HARNESS_DOWN_HOSTS / HARNESS_REPLICA_LAG) they change
+while a controlled clock moves through the lag check and retry intervals.
+"""
+
+import pytest
+
+import pymysql
+from profiles_common import db_connection, metrics
+
+
+def test_connection_counters_reach_the_request_metrics(database, monkeypatch):
+    records = []
+    monkeypatch.setattr(metrics, "_sink", records.append)
+
+    @metrics.instrumented("check")
+    def handler(event, context):
+        cursor = db_connection.open_cursor()
+        db_connection.release_cursor(cursor)
+
+    handler({}, None)
+    handler({}, None)
+    # the socket breaks between two requests
+    db_connection._connection.close()
+    handler({}, None)
+
+    assert records[0]["db_opened"] == 1 and "db_reused" not in records[0]
+    assert records[1]["db_reused"] == 1 and "db_opened" not in records[1]
+    assert records[2]["db_reconnected"] == 1
+    assert {"Name": "db_opened", "Unit": "Count"} in records[0]["_aws"]["CloudWatchMetrics"][0]["Metrics"]
+
+
+class Clock:
+    """Class standing for time.monotonic, moved forward by the checks."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def replicas(database, monkeypatch):
+    """Function to configure two replicas, r1 and r2, all up and in sync, with a controlled clock."""
+    clock = Clock()
+    monkeypatch.setattr(db_connection, "time", clock)
+    monkeypatch.setattr(db_connection, "REPLICA_ENDPOINTS", ["r1:3307", "r2"])
+    monkeypatch.setattr(db_connection, "REPLICA_SELECTION", "round_robin")
+    monkeypatch.setattr(db_connection, "_next_replica", 0)
+    monkeypatch.setattr(pymysql, "DOWN_HOSTS", set())
+    monkeypatch.setattr(pymysql, "REPLICA_LAG", {"r1": 0, "r2": 0})
+    return clock
+
+
+def read_host():
+    """Function to get the host a read cursor is opened on."""
+    cursor = db_connection.open_read_cursor()
+    try:
+        cursor.execute("SELECT 1")
+        return cursor.connection.host
+    finally:
+        db_connection.release_cursor(cursor)
+
+
+def test_reads_use_a_replica_and_writes_the_primary(replicas):
+    assert read_host() == "r1"
+    assert read_host() == "r1"
+    assert db_connection.open_cursor().connection.host == "primary"
+    assert db_connection.stats["replica_opened"] == 1 and db_connection.stats["replica_reads"] == 2
+
+
+def test_lagging_or_stopped_replicas_are_skipped(replicas):
+    pymysql.REPLICA_LAG.update({"r1": 60})
+    assert read_host() == "r2"
+    db_connection.close_read_connection()
+    # r2 is not replicating (no SHOW REPLICA STATUS row), r1 is still marked down
+    del pymysql.REPLICA_LAG["r2"]
+    assert read_host() == "primary"
+    assert db_connection.stats["primary_fallbacks"] == 1
+
+
+def test_replica_down_until_retry_after(replicas):
+    pymysql.DOWN_HOSTS.update({"r1", "r2"})
+    assert read_host() == "primary"
+    pymysql.DOWN_HOSTS.clear()
+    # both replicas stay skipped until REPLICA_RETRY_AFTER has passed
+    replicas.now += db_connection.REPLICA_RETRY_AFTER - 1
+    assert read_host() == "primary"
+    replicas.now += 2
+    assert read_host() in ("r1", "r2")
+
+
+def test_replica_falling_behind_is_dropped_at_the_next_lag_check(replicas):
+    assert read_host() == "r1"
+    pymysql.REPLICA_LAG["r1"] = 60
+    # the lag is only read again after REPLICA_LAG_CHECK_INTERVAL
+    replicas.now += db_connection.REPLICA_LAG_CHECK_INTERVAL - 1
+    assert read_host() == "r1"
+    replicas.now += 2
+    assert read_host() == "r2"
+    assert db_connection._replica_down["r1:3307"] == replicas.now + db_connection.REPLICA_RETRY_AFTER
+
+
+def test_broken_replica_connection_is_replaced(replicas):
+    assert read_host() == "r1"
+    db_connection._replica.close()
+    assert read_host() == "r2"
@@ -0,0 +1,24 @@
+"""Checks of profiles_common.message_catalog on the messages of ProfilesDeletePicture."""
+
+import os
+
+import pytest
+
+from conftest import ROOT
+from profiles_common.message_catalog import MessageCatalog
+
+messages = MessageCatalog(os.path.join(ROOT, 'ProfilesDeletePicture', 'deletepicture.properties'),
+                          status_codes={'INVALID_USER': 404})
+
+
+@pytest.mark.parametrize("language_id", [245, "245"])
+def test_language_id_claim_as_int_or_string(language_id):
+    assert messages.message('INVALID_USER', language_id) == messages.message('INVALID_USER', 245)
+    assert messages.message('INVALID_USER', language_id) != messages.message('INVALID_USER', 165)
+    assert messages.error('INVALID_USER', language_id)["body"] == messages.body('INVALID_USER', 245)
+
+
+@pytest.mark.parametrize("language_id", [None, "x", "999", 999])
+def test_unknown_language_uses_the_default(language_id):
+    assert messages.body('INVALID_USER', language_id) == messages.body('INVALID_USER', 165)
+    assert messages.error('INVALID_USER', language_id)["statusCode"] == 404
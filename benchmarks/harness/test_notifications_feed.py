@@ -0,0 +1,62 @@
+"""Checks of the notifications feed of ProfilesActiveNotifications against the harness stand-ins."""
+
+import json
+
+import pytest
+
+from conftest import add_function_path, load_handler, make_token
+from profiles_common import db_connection
+
+add_function_path('ProfilesActiveNotifications')
+import notifications_feed
+
+
+def add_notification(db, rid, text, timestamp="2030-01-01 00:00:00"):
+    """Function to insert an unvisited notification of the user, returning its id."""
+    return db.execute("INSERT INTO `notifications` (`rid`, `notification_type`, `json`, `visited`, `timestamp`)"
+                      " VALUES (?, 'message', ?, 0, ?)", (rid, text, timestamp)).lastrowid
+
+
+@pytest.mark.parametrize("text", ['{"a":}', '"abc", "d"', '[1, 2', '{"a": 1}}'])
+def test_malformed_json_fails_and_stays_unvisited(database, text):
+    notification_id = add_notification(database, 1, text)
+    cursor = db_connection.open_cursor()
+    try:
+        with pytest.raises(ValueError):
+            notifications_feed.fetch_and_acknowledge(cursor, 1, "user-000001", 200)
+    finally:
+        db_connection.release_cursor(cursor)
+    assert database.execute("SELECT `visited` FROM `notifications` WHERE `id`=?", (notification_id,)).fetchone()[0] == 0
+
+
+def test_valid_json_is_spliced_as_stored(database):
+    add_notification(database, 1, ' {"b": [1, 2], "a": "x"} ')
+    cursor = db_connection.open_cursor()
+    try:
+        user, rows, body, has_more = notifications_feed.fetch_and_acknowledge(cursor, 1, "user-000001", 1)
+    finally:
+        db_connection.release_cursor(cursor)
+    assert '"notification_json": {"b": [1, 2], "a": "x"}' in body
+    assert json.loads(body)[0]["notification_json"] == {"b": [1, 2], "a": "x"}
+    assert database.execute("SELECT `visited` FROM `notifications` WHERE `id`=?", (rows[0][0],)).fetchone()[0] == 1
+
+
+def test_since_polling_returns_every_new_notification(database):
+    handler = load_handler('ProfilesActiveNotifications', 'api-getactivenotifications')
+    token = make_token(1, "user-000001")
+    database.execute("UPDATE `notifications` SET `visited`=1 WHERE `rid`=1")
+    # five notifications arrive after the since cursor of the client, polled two at a time
+    for i in range(5):
+        add_notification(database, 1, '{"n": %d}' % i, "2030-01-01 00:00:%02d" % i)
+
+    received, since = [], notifications_feed.encode_cursor("2029-12-31 00:00:00", 0)
+    for _ in range(5):
+        response = handler.handler({"headers": {"Authorization": token},
+                                    "queryStringParameters": {"limit": "2", "since": since}}, None)
+        assert response["statusCode"] == 200
+        page = [item["notification_json"]["n"] for item in json.loads(response["body"])]
+        received += page
+        since = response["headers"]["X-Since-Cursor"]
+        if not page:
+            break
+    assert sorted(received) == [0, 1, 2, 3, 4]
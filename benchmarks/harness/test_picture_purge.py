@@ -0,0 +1,135 @@
+"""Checks of the bulk picture purge of ProfilesDeletePicture against the harness stand-ins.
+
+S3 failures are injected by replacing picture_deletions.delete_objects, and a DB failure
+by replacing picture_purge.clear_chunk, then the purge is resumed from its checkpoint.
+"""
+
+import time
+import json
+
+import boto3
+import pytest
+
+from conftest import add_function_path
+from profiles_common import db_connection
+
+add_function_path('ProfilesDeletePicture')
+import picture_purge
+import picture_deletions
+
+BUCKET = "harness-bucket"
+CHUNK = 20
+
+
+@pytest.fixture
+def purge_setup(database, monkeypatch, tmp_path):
+    """Function to get the user ids of the seeded users, with their pictures in the local bucket."""
+    user_ids = [row[0] for row in database.execute("SELECT `user_id` FROM `users` ORDER BY `id` LIMIT 100")]
+    monkeypatch.setattr(boto3, "objects", {(BUCKET, picture_deletions.object_key(user_id)): b"png" for user_id in user_ids})
+    cursor = db_connection.open_cursor()
+    yield user_ids, cursor, str(tmp_path / "purge.json")
+    db_connection.release_cursor(cursor)
+
+
+def outbox_keys(db):
+    """Function to get the keys waiting in the picture_deletions outbox."""
+    return {row[0] for row in db.execute("SELECT `object_key` FROM `picture_deletions`")}
+
+
+def cleared_users(db, user_ids):
+    """Function to count the users of the list whose picture is cleared."""
+    return db.execute("SELECT COUNT(*) FROM `users` WHERE `picture_url` IS NULL AND `user_id` IN (%s)"
+                      % ",".join("?" * len(user_ids)), user_ids).fetchone()[0]
+
+
+def test_purge_clears_users_and_deletes_their_pictures(database, purge_setup):
+    user_ids, cursor, checkpoint = purge_setup
+    report = picture_purge.purge(user_ids + ["nobody-1", "nobody-2"], cursor, checkpoint, chunk_size=CHUNK, workers=3)
+    assert report["processed"] == 102
+    assert report["users_found"] == report["users_updated"] == report["deleted"] == 100
+    assert report["failed"] == 0
+    assert cleared_users(database, user_ids) == 100
+    assert boto3.objects == {}
+    assert outbox_keys(database) == set()
+    assert json.load(open(checkpoint))["processed"] == 102
+
+
+def test_failed_s3_keys_stay_in_the_outbox(database, purge_setup, monkeypatch):
+    user_ids, cursor, checkpoint = purge_setup
+    real = picture_deletions.delete_objects
+    refused = {picture_deletions.object_key(user_id) for user_id in user_ids[:3]}
+    failing_chunk = {picture_deletions.object_key(user_id) for user_id in user_ids[40:60]}
+
+    def delete_objects(keys, bucket=None):
+        if set(keys) == failing_chunk:
+            raise ConnectionError("S3 unreachable")
+        errors = real([key for key in keys if key not in refused], bucket)
+        return dict(errors, **{key: "AccessDenied" for key in keys if key in refused})
+
+    monkeypatch.setattr(picture_deletions, "delete_objects", delete_objects)
+    report = picture_purge.purge(user_ids, cursor, checkpoint, chunk_size=CHUNK, workers=3)
+    assert report["processed"] == 100
+    assert report["failed"] == 23 and report["deleted"] == 77
+    # the users are cleared, the keys S3 did not delete wait for the drain
+    assert cleared_users(database, user_ids) == 100
+    assert outbox_keys(database) == refused | failing_chunk
+    assert {key for _, key in boto3.objects} == refused | failing_chunk
+
+
+def test_purge_stopped_by_a_db_error_resumes_from_its_checkpoint(database, purge_setup, monkeypatch):
+    user_ids, cursor, checkpoint = purge_setup
+    real = picture_purge.clear_chunk
+    calls = []
+
+    def clear_chunk(cursor, chunk):
+        calls.append(chunk)
+        if len(calls) == 4:
+            raise RuntimeError("lost connection to the database")
+        return real(cursor, chunk)
+
+    monkeypatch.setattr(picture_purge, "clear_chunk", clear_chunk)
+    with pytest.raises(RuntimeError):
+        picture_purge.purge(user_ids, cursor, checkpoint, chunk_size=CHUNK, workers=2)
+    # the three committed chunks were deleted from S3 before the error came through
+    assert json.load(open(checkpoint))["processed"] == 3 * CHUNK
+    assert cleared_users(database, user_ids) == 3 * CHUNK
+
+    monkeypatch.setattr(picture_purge, "clear_chunk", real)
+    report = picture_purge.purge(user_ids, cursor, checkpoint, chunk_size=CHUNK, workers=2)
+    assert report["skipped"] == 3 * CHUNK
+    assert report["processed"] == 100 and report["deleted"] == 100
+    assert cleared_users(database, user_ids) == 100
+    assert boto3.objects == {} and outbox_keys(database) == set()
+
+
+def test_checkpoint_waits_for_the_earlier_chunks(database, purge_setup, monkeypatch):
+    user_ids, cursor, checkpoint = purge_setup
+    real = picture_deletions.delete_objects
+    first_chunk = {picture_deletions.object_key(user_id) for user_id in user_ids[:CHUNK]}
+    finished = []
+
+    def delete_objects(keys, bucket=None):
+        if set(keys) == first_chunk:
+            # the first chunk finishes after the later ones
+            time.sleep(0.2)
+        errors = real(keys, bucket)
+        finished.append(user_ids.index(keys[0][:-len(".png")]) // CHUNK)
+        return errors
+
+    saved = []
+    real_save = picture_purge.save_checkpoint
+
+    def save_checkpoint(path, state):
+        # the chunks finished in a row from the first one
+        done = 0
+        while done in finished:
+            done += 1
+        saved.append((state["processed"], done * CHUNK))
+        real_save(path, state)
+
+    monkeypatch.setattr(picture_deletions, "delete_objects", delete_objects)
+    monkeypatch.setattr(picture_purge, "save_checkpoint", save_checkpoint)
+    picture_purge.purge(user_ids, cursor, checkpoint, chunk_size=CHUNK, workers=3, max_pending=2)
+    assert finished[0] != 0
+    assert saved and all(processed <= done for processed, done in saved)
+    assert saved[-1][0] == 100
@@ -0,0 +1,28 @@
+"""Checks of the question responses of ProfilesGetQuestions against the harness stand-ins."""
+
+from conftest import load_handler
+
+handler = load_handler('ProfilesGetQuestions', 'api-getquestions')
+
+QUESTIONS = ('[{"id": 1, "question": "Q1"}]', "abc123")
+
+
+def respond(headers):
+    """Function to get the questions response of language 165 for the request headers."""
+    return handler.questions_response({"headers": headers}, 165, QUESTIONS, 42)
+
+
+def test_etag_differs_per_content_coding():
+    identity = respond({})
+    gzipped = respond({"Accept-Encoding": "gzip"})
+    assert identity["headers"]["ETag"] == '"abc123-42"'
+    assert gzipped["headers"]["ETag"] == '"abc123-42-gzip"'
+    assert gzipped["headers"]["Content-Encoding"] == "gzip"
+
+
+def test_if_none_match_accepts_the_coded_and_identity_tags():
+    for tag in ('"abc123-42-gzip"', 'W/"abc123-42-gzip"', '"abc123-42"', 'W/"abc123-42"', '"other", "abc123-42"'):
+        response = respond({"Accept-Encoding": "gzip", "If-None-Match": tag})
+        assert response["statusCode"] == 304, tag
+        assert response["headers"]["ETag"] == '"abc123-42-gzip"'
+    assert respond({"Accept-Encoding": "gzip", "If-None-Match": '"abc123-41-gzip"'})["statusCode"] == 200
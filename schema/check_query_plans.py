@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+"""Query plan regression check for the statements the handlers issue.
+
+It provides the following functionalities:
+1. collect_statements(): Getting the SQL statements of the handlers, built by the handlers' own code
+2. apply_migrations(): Running schema/migrations/*.sql in order (all of them can be run again)
+3. explain_mysql() / explain_sqlite(): Getting the plan of a statement from MySQL EXPLAIN or
+   SQLite EXPLAIN QUERY PLAN
+4. plan_problems(): Finding the full table / index scans and filesorts of a plan
+5. main(): Explaining every statement and exiting with status 1 when a plan has problems
+
+Usage: python schema/check_query_plans.py [--migrate] [--verbose]
+       python schema/check_query_plans.py --sqlite harness.sqlite [--verbose]
+
+Without --sqlite the MySQL database of ENDPOINT / PORT / DBUSER / DBPASSWORD / DATABASE
+is used, like the handlers do. The optimizer picks plans from the table statistics, so
+check against a database holding representative data (e.g. a restored snapshot), not
+empty tables. --sqlite checks the database seeded by benchmarks/harness instead, its
+plans follow the indexes of seed.py, which mirror the migrations.
+"""
+
+import os
+import re
+import sys
+import glob
+import argparse
+import importlib
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+LAYER = os.path.join(ROOT, 'ProfilesCommon', 'python')
+MIGRATIONS = os.path.join(ROOT, 'schema', 'migrations')
+HANDLER_DIRS = ('ProfilesActiveNotifications', 'ProfilesDeletePicture', 'ProfilesGetQuestions')
+
+# statements that are not checked, with the reason
+SKIPPED = {
+    "user count (estimate)": "reads information_schema.TABLES, not a table of the schema",
+}
+# statements only checked on MySQL, SQLite cannot parse them
+MYSQL_ONLY = {
+    "picture deletions retry": "INTERVAL arithmetic is MySQL syntax",
+}
+
+# a notification position used for the cursor variants of the feed queries
+POSITION = ("2024-06-01 12:00:00", 1000)
+
+
+class RecordingCursor:
+    """Class standing for a cursor that records the statements instead of running them."""
+
+    def __init__(self):
+        self.statements = []
+        self.connection = self
+        self.rowcount = 0
+
+    def execute(self, query, args=None):
+        if args is not None and not isinstance(args, (tuple, list)):
+            args = (args,)
+        self.statements.append((query, tuple(args or ())))
+        return 0
+
+    def fetchone(self):
+        # the single row of COUNT(*) style statements
+        return (0,)
+
+    def fetchall(self):
+        return ()
+
+    def __iter__(self):
+        return iter(())
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def collect_statements():
+    """Function to get the (name, query, args) of every statement the handlers issue, INSERTs excepted."""
+    sys.path[:0] = [LAYER] + [os.path.join(ROOT, directory) for directory in HANDLER_DIRS]
+    os.environ.setdefault('LOGGING_LEVEL', '40')
+    from profiles_common import jwt_auth
+    import notifications_feed
+    import notification_badges
+    import picture_deletions
+    import picture_purge
+    import user_counter
+    import question_bundles
+    deletepicture = importlib.import_module('api-deletepicture')
+
+    statements = []
+
+    def record(name, call, *args):
+        cursor = RecordingCursor()
+        call(cursor, *args)
+        for index, (query, query_args) in enumerate(cursor.statements):
+            statements.append((name if index == 0 else "%s #%d" % (name, index + 1), query, query_args))
+
+    record("notifications count", notifications_feed.count_unvisited, 1)
+    record("notifications count since", notifications_feed.count_unvisited, 1, POSITION)
+    record("notifications page", notifications_feed.fetch_page, 1, 50)
+    record("notifications page before", notifications_feed.fetch_page, 1, 50, POSITION)
+    record("notifications page since", notifications_feed.fetch_page, 1, 50, None, POSITION)
+    record("notifications user page", notifications_feed.fetch_and_acknowledge, 1, "user-000001", 50)
+    record("notifications user page before", notifications_feed.fetch_and_acknowledge, 1, "user-000001", 50, POSITION)
+    record("notifications mark visited", notifications_feed.mark_visited, 1, [1, 2])
+    record("notification badge", lambda cursor: cursor.execute(notification_badges.BADGE_QUERY, (1,)))
+    record("user language", lambda cursor: cursor.execute(jwt_auth.USER_LANGUAGE_QUERY, (1, "user-000001")))
+    for source, query in sorted(user_counter.COUNT_QUERIES.items()):
+        record("user count (%s)" % source, lambda cursor: cursor.execute(query))
+    record("questions", question_bundles.fetch_questions_json, 165)
+    record("translated questions", question_bundles.fetch_questions_json, 245)
+    record("clear picture", lambda cursor: cursor.execute(deletepicture.CLEAR_PICTURE_QUERY, (1,)))
+    record("picture deletions due", lambda cursor: cursor.execute(picture_deletions.DUE_QUERY,
+                                                                  (picture_deletions.MAX_ATTEMPTS, picture_deletions.BATCH_SIZE)))
+    record("picture deletions delete", picture_deletions._delete_rows, [1, 2])
+    record("picture deletions retry", picture_deletions._retry_later, [1, 2], "InternalError")
+    record("picture purge lookup", lambda cursor: cursor.execute(
+        picture_purge.EXISTING_USERS_QUERY.format(placeholders="%s,%s"), ("user-000001", "user-000002")))
+    record("picture purge clear", lambda cursor: cursor.execute(
+        picture_purge.CLEAR_PICTURES_QUERY.format(placeholders="%s,%s"), ("user-000001", "user-000002")))
+    record("picture purge dequeue", picture_purge._dequeue, ["user-000001.png", "user-000002.png"])
+    return statements
+
+
+def apply_migrations(connection):
+    """Function to run every migration file in order."""
+    for path in sorted(glob.glob(os.path.join(MIGRATIONS, '*.sql'))):
+        with open(path) as migration:
+            text = "\n".join(line for line in migration.read().splitlines() if not line.lstrip().startswith('--'))
+        cursor = connection.cursor()
+        # the statements of the migrations end with a ; at the end of a line
+        for statement in re.split(r";\s*$", text, flags=re.MULTILINE):
+            if statement.strip():
+                cursor.execute(statement)
+        cursor.close()
+        print("Applied %s" % os.path.basename(path))
+
+
+def explain_mysql(connection, query, args):
+    """Function to get the EXPLAIN rows of a statement as dicts."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("EXPLAIN " + query, args)
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def explain_sqlite(connection, query, args):
+    """Function to get the EXPLAIN QUERY PLAN rows of a statement as dicts."""
+    rows = connection.execute("EXPLAIN QUERY PLAN " + query.replace("%s", "?"), args).fetchall()
+    return [{"detail": row[3]} for row in rows]
+
+
+def plan_problems(plan):
+    """Function to get the full scans and filesorts of a plan, MySQL or SQLite."""
+    problems = []
+    for row in plan:
+        if "detail" in row:
+            detail = row["detail"]
+            if detail.startswith("SCAN ") and detail != "SCAN CONSTANT ROW":
+                problems.append("full scan: " + detail)
+            elif "TEMP B-TREE FOR ORDER BY" in detail:
+                problems.append("filesort: " + detail)
+            continue
+        # type ALL reads the whole table, index the whole index
+        if row.get("type") in ("ALL", "index"):
+            problems.append("full scan of %s (type %s)" % (row.get("table"), row["type"]))
+        if "Using filesort" in (row.get("Extra") or ""):
+            problems.append("filesort on %s" % row.get("table"))
+    return problems
+
+
+def describe(plan):
+    """Function to get a one line summary of a plan."""
+    if plan and "detail" in plan[0]:
+        return "; ".join(row["detail"] for row in plan)
+    return "; ".join("%s %s key=%s %s" % (row.get("table"), row.get("type"), row.get("key"), row.get("Extra") or "")
+                     for row in plan)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sqlite', help="check the SQLite database seeded by benchmarks/harness instead of MySQL")
+    parser.add_argument('--migrate', action='store_true', help="run schema/migrations before checking (MySQL)")
+    parser.add_argument('--verbose', action='store_true', help="print the plan of every statement")
+    args = parser.parse_args()
+
+    statements = collect_statements()
+    if args.sqlite:
+        import sqlite3
+        connection = sqlite3.connect(args.sqlite)
+        explain = explain_sqlite
+    else:
+        from profiles_common import db_connection
+        connection = db_connection.get_connection()
+        if args.migrate:
+            apply_migrations(connection)
+        explain = explain_mysql
+
+    skipped = dict(SKIPPED, **MYSQL_ONLY) if args.sqlite else SKIPPED
+    failed = checked = 0
+    for name, query, query_args in statements:
+        if name in skipped:
+            print("skip  %-36s %s" % (name, skipped[name]))
+            continue
+        checked += 1
+        try:
+            plan = explain(connection, query, query_args)
+        except Exception as e:
+            failed += 1
+            print("error %-36s %s" % (name, e))
+            continue
+        problems = plan_problems(plan)
+        failed += bool(problems)
+        print("%-5s %-36s %s" % ("FAIL" if problems else "ok", name, "; ".join(problems)))
+        if args.verbose or problems:
+            print("      %s\n      %s" % (query, describe(plan)))
+
+    print("%d of %d statements failed" % (failed, checked))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+-- Maintained count of active users, read by ProfilesGetQuestions when
+-- USER_COUNT_SOURCE=counter_row instead of running COUNT(*) over `users`.
+-- Only run it for deployments using that source, the triggers write on every
+-- insert, delete and (de)activation of a user.
+--
+-- The update trigger only touches the counter row when `is_active` changes, so
+-- the other writes of `users` (pictures, profile edits) do not queue on its
+-- lock. Run it when few users are written: a user inserted or (de)activated
+-- between the backfill and the creation of the triggers is not counted.
+
+CREATE TABLE IF NOT EXISTS `user_counters` (
+    `name`  VARCHAR(64) NOT NULL,
+    `value` BIGINT      NOT NULL DEFAULT 0,
+    PRIMARY KEY (`name`)
+) ENGINE=InnoDB;
+
+INSERT INTO `user_counters` (`name`, `value`)
+    SELECT 'active_users', COUNT(*) FROM `users` WHERE `is_active`=1
+    ON DUPLICATE KEY UPDATE `value`=VALUES(`value`);
+
+DROP TRIGGER IF EXISTS `users_active_count_insert`;
+CREATE TRIGGER `users_active_count_insert` AFTER INSERT ON `users` FOR EACH ROW
+    UPDATE `user_counters` SET `value` = `value` + (NEW.`is_active` = 1)
+    WHERE `name`='active_users';
+
+DROP TRIGGER IF EXISTS `users_active_count_update`;
+CREATE TRIGGER `users_active_count_update` AFTER UPDATE ON `users` FOR EACH ROW
+    UPDATE `user_counters` SET `value` = `value` + (NEW.`is_active` = 1) - (OLD.`is_active` = 1)
+    WHERE `name`='active_users' AND NEW.`is_active` <> OLD.`is_active`;
+
+DROP TRIGGER IF EXISTS `users_active_count_delete`;
+CREATE TRIGGER `users_active_count_delete` AFTER DELETE ON `users` FOR EACH ROW
+    UPDATE `user_counters` SET `value` = `value` - (OLD.`is_active` = 1)
+    WHERE `name`='active_users';
@@ -0,0 +1,15 @@
+-- Outbox of profile pictures waiting to be deleted from S3, written by
+-- ProfilesDeletePicture and drained by picture_deletions.drain_handler.
+
+CREATE TABLE IF NOT EXISTS `picture_deletions` (
+    `id`              BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+    `object_key`      VARCHAR(255)    NOT NULL,
+    `user_id`         VARCHAR(255)    NOT NULL,
+    `attempts`        INT             NOT NULL DEFAULT 0,
+    `next_attempt_at` DATETIME        NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    `last_error`      VARCHAR(255)    NULL,
+    `created_at`      DATETIME        NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (`id`),
+    UNIQUE KEY `uq_picture_deletions_object_key` (`object_key`),
+    KEY `idx_picture_deletions_due` (`next_attempt_at`, `attempts`)
+) ENGINE=InnoDB;
@@ -0,0 +1,61 @@
+-- Indexes serving the queries of the handlers, checked by schema/check_query_plans.py.
+--
+-- Each index is only added when no index of that name exists, so the file can be
+-- run again. ALGORITHM=INPLACE, LOCK=NONE builds them online, without blocking
+-- the writes of the handlers. Drop any older equivalent index afterwards (e.g. a
+-- single column index on notifications.rid), it is superseded by these ones.
+--
+-- users WHERE id=? AND user_id=? needs no index of its own: id is the primary
+-- key and the clustered row already holds user_id and language_id.
+
+-- notifications WHERE rid=? AND visited=0 [AND timestamp/id cursor] ORDER BY timestamp DESC, id DESC:
+-- equality on (rid, visited) then the index order is the page order, no filesort.
+-- The unread count is answered from this index alone.
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS
+               WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME='notifications'
+                 AND INDEX_NAME='idx_notifications_rid_visited_timestamp') = 0,
+              'ALTER TABLE `notifications` ADD INDEX `idx_notifications_rid_visited_timestamp` (`rid`, `visited`, `timestamp`, `id`), ALGORITHM=INPLACE, LOCK=NONE',
+              'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- users WHERE is_active=1: COUNT(*) of ProfilesGetQuestions answered from this index alone.
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS
+               WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME='users'
+                 AND INDEX_NAME='idx_users_is_active') = 0,
+              'ALTER TABLE `users` ADD INDEX `idx_users_is_active` (`is_active`), ALGORITHM=INPLACE, LOCK=NONE',
+              'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- users joined on user_id by the picture_deletions drain.
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS
+               WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME='users'
+                 AND INDEX_NAME='idx_users_user_id') = 0,
+              'ALTER TABLE `users` ADD INDEX `idx_users_user_id` (`user_id`), ALGORITHM=INPLACE, LOCK=NONE',
+              'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- questions_120 WHERE language_id=?
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS
+               WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME='questions_120'
+                 AND INDEX_NAME='idx_questions_120_language') = 0,
+              'ALTER TABLE `questions_120` ADD INDEX `idx_questions_120_language` (`language_id`, `id`), ALGORITHM=INPLACE, LOCK=NONE',
+              'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- questions_120_translations WHERE language_id=?
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS
+               WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME='questions_120_translations'
+                 AND INDEX_NAME='idx_questions_120_translations_language') = 0,
+              'ALTER TABLE `questions_120_translations` ADD INDEX `idx_questions_120_translations_language` (`language_id`, `question_id`), ALGORITHM=INPLACE, LOCK=NONE',
+              'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
@@ -0,0 +1,34 @@
+-- Unread badge of every user, read by ProfilesActiveNotifications for
+-- badge=true requests instead of counting `notifications`.
+--
+-- `unread` is the number of unvisited notifications of the user and `version`
+-- grows with every insert, visit or delete of one of them. The triggers keep
+-- both up to date whoever writes `notifications`. Run it when few
+-- notifications are written: a notification written between the backfill and
+-- the creation of the triggers is not counted.
+
+CREATE TABLE IF NOT EXISTS `notification_badges` (
+    `rid`     BIGINT NOT NULL,
+    `unread`  BIGINT NOT NULL DEFAULT 0,
+    `version` BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (`rid`)
+) ENGINE=InnoDB;
+
+INSERT INTO `notification_badges` (`rid`, `unread`, `version`)
+    SELECT `rid`, SUM(`visited` = 0), 1 FROM `notifications` GROUP BY `rid`
+    ON DUPLICATE KEY UPDATE `unread`=VALUES(`unread`), `version`=`version` + 1;
+
+DROP TRIGGER IF EXISTS `notifications_badge_insert`;
+CREATE TRIGGER `notifications_badge_insert` AFTER INSERT ON `notifications` FOR EACH ROW
+    INSERT INTO `notification_badges` (`rid`, `unread`, `version`) VALUES (NEW.`rid`, (NEW.`visited` = 0), 1)
+    ON DUPLICATE KEY UPDATE `unread` = `unread` + (NEW.`visited` = 0), `version` = `version` + 1;
+
+DROP TRIGGER IF EXISTS `notifications_badge_update`;
+CREATE TRIGGER `notifications_badge_update` AFTER UPDATE ON `notifications` FOR EACH ROW
+    UPDATE `notification_badges` SET `unread` = `unread` + (NEW.`visited` = 0) - (OLD.`visited` = 0), `version` = `version` + 1
+    WHERE `rid`=NEW.`rid` AND NEW.`visited` <> OLD.`visited`;
+
+DROP TRIGGER IF EXISTS `notifications_badge_delete`;
+CREATE TRIGGER `notifications_badge_delete` AFTER DELETE ON `notifications` FOR EACH ROW
+    UPDATE `notification_badges` SET `unread` = `unread` - (OLD.`visited` = 0), `version` = `version` + 1
+    WHERE `rid`=OLD.`rid`;